@@ -1,29 +1,97 @@
-import pygame
+import time
+_IMPORT_START = time.perf_counter()
+import os
 import sys
+import json
+import mmap
 import math
 import random
+import itertools
+import collections
+import argparse
+import hashlib
+import tempfile
+import threading
+import multiprocessing
 import numpy as np
 
-# Parámetros del jugador
+# pygame se importa al primer uso (load_pygame): importarlo cuesta más que
+# todo el resto del módulo y la simulación (GameState) no lo necesita.
+pygame = None
+
+# Parámetros del jugador (por paso de simulación)
 player_speed = 0.05
+player_turn_speed = 0.03
+
+# Pose de la cámara con la que se dibuja el fotograma; run_frame la copia de
+# la partida en curso (world) interpolando entre pasos de simulación.
 player_x = 1.5
 player_y = 1.5
 player_angle = 0.0
-player_lives = 3
-
-# Pre-inicialización del mezclador para sonido monofónico
-pygame.mixer.pre_init(44100, -16, 1, 512)
-pygame.init()
 
-if pygame.mixer.get_init() is None:
-    try:
-        pygame.mixer.init(44100, -16, 1, 512)
-        print("Mixer manualmente inicializado.")
-    except pygame.error as e:
-        print(f"Error al inicializar el mezclador: {e}")
-        sys.exit("No se pudo inicializar el mezclador.")
-else:
-    print("Mixer ya está inicializado.")
+# =====================================================
+# A0. ARRANQUE PEREZOSO DE LOS SUBSISTEMAS
+# =====================================================
+# Importar el módulo no abre ventana, no toca el audio ni genera el
+# laberinto: cada subsistema se inicializa la primera vez que se usa y anota
+# lo que tardó en STARTUP_TIMES (ver startup_report).
+
+STARTUP_TIMES = {}  # Subsistema -> segundos que tardó en inicializarse
+STARTUP_REPORT = False  # Imprime startup_report al dibujar el primer fotograma de juego
+_screen = None
+_mixer_ready = None  # None = sin intentar; True/False = resultado del intento
+
+def load_pygame():
+    """Importa pygame la primera vez que hace falta. Devuelve el módulo, o None si no está instalado."""
+    global pygame
+    if pygame is None and "pygame" not in STARTUP_TIMES:
+        start = time.perf_counter()
+        # Sin el saludo de pygame en la salida estándar, donde --bench escribe su informe JSON
+        os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+        try:
+            import pygame as module
+            pygame = module
+        except ImportError:
+            pass
+        STARTUP_TIMES["pygame"] = time.perf_counter() - start
+    return pygame
+
+def init_display():
+    """Abre la ventana del juego (inicializando vídeo y fuentes) la primera vez y la devuelve."""
+    global _screen
+    if _screen is None:
+        load_pygame()
+        start = time.perf_counter()
+        pygame.display.init()
+        pygame.font.init()
+        _screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        pygame.display.set_caption("ENTropia 3D")
+        STARTUP_TIMES["display"] = time.perf_counter() - start
+    return _screen
+
+def init_mixer():
+    """
+    Inicializa el mezclador (mono, 44.1 kHz) la primera vez que se pide.
+    Devuelve si hay audio; si el dispositivo falla, el juego sigue sin sonido.
+    """
+    global _mixer_ready
+    if _mixer_ready is None:
+        start = time.perf_counter()
+        _mixer_ready = False
+        if load_pygame() is not None:
+            try:
+                pygame.mixer.init(44100, -16, 1, 512)
+                _mixer_ready = True
+            except pygame.error as e:
+                print(f"Error al inicializar el mezclador: {e}", file=sys.stderr)
+        STARTUP_TIMES["mixer"] = time.perf_counter() - start
+    return _mixer_ready
+
+def startup_report():
+    """Imprime lo que tardó cada fase del arranque, en milisegundos."""
+    print("Arranque (ms):")
+    for name, seconds in STARTUP_TIMES.items():
+        print(f"  {name:<12} {seconds * 1000:8.1f}")
 
 # =====================================================
 # A. CONFIGURACIÓN INICIAL Y CONSTANTES
@@ -36,6 +104,17 @@ NUM_RAYS = 400              # Número de rayos a proyectar
 DELTA_ANGLE = FOV / NUM_RAYS
 MAX_DEPTH = 20
 SCALE = WIDTH / NUM_RAYS
+RAYCAST_BACKEND = "numpy"   # "numpy" (vectorizado) o "python" (bucle original por rayo)
+WALL_RENDERER = "framebuffer"  # "framebuffer" (surfarray), "rects" (un draw.rect por rayo) o "textured"
+
+# Tabla de sombreado precalculada: distancia cuantizada -> intensidad de gris.
+# Más allá de SHADE_MAX_DISTANCE el muro es prácticamente negro.
+SHADE_STEPS_PER_UNIT = 16
+SHADE_MAX_DISTANCE = 64
+_shade_distances = np.arange(SHADE_MAX_DISTANCE * SHADE_STEPS_PER_UNIT + 1) / SHADE_STEPS_PER_UNIT
+SHADE_LUT = (255 / (1 + _shade_distances * _shade_distances * 0.1)).astype(np.uint32)
+# Los píxeles del framebuffer son enteros de 32 bits con formato 0xRRGGBB
+SHADE_LUT_PIXELS = SHADE_LUT * 0x010101
 
 # Colores
 BLACK = (0, 0, 0)
@@ -44,13 +123,94 @@ WHITE = (255, 255, 255)
 RED = (255, 0, 0)
 YELLOW = (255, 255, 0)
 
+# Valores de las celdas del mapa
+OPEN_CELL = 0
+WALL_CELL = 1
+
 # Parámetros del laberinto (debe ser impar para generar pasillos)
 MAZE_WIDTH = 91
 MAZE_HEIGHT = 81
+MAZE_SEED = None  # Semilla del generador (None = laberinto distinto en cada partida)
 
 CALIZ_SIZE = 0.8 / 3.0  # Un tercio del tamaño base del enemigo (se asume 0.8)
 CALIZ_COLOR = (0, 0, 255)  # Azul (puedes ajustar el tono si lo deseas)
 
+# Menús: las fuentes y los textos renderizados se guardan y se reutilizan
+MENU_FPS = 30  # Tope de iteraciones por segundo del bucle de los menús
+TEXT_CACHE_SIZE = 256  # Superficies de texto que se conservan (las menos usadas se descartan)
+_fonts = {}
+_text_cache = collections.OrderedDict()
+
+def get_font(size, name="Arial"):
+    """Fuente del sistema 'name' a 'size' puntos; SysFont es lento, así que cada fuente se crea una vez."""
+    font = _fonts.get((name, size))
+    if font is None:
+        font = _fonts[(name, size)] = pygame.font.SysFont(name, size)
+    return font
+
+def render_text(font, text, color):
+    """font.render (con antialiasing) cacheado por (fuente, texto, color)."""
+    key = (font, text, color)
+    surface = _text_cache.get(key)
+    if surface is None:
+        surface = _text_cache[key] = font.render(text, True, color)
+        if len(_text_cache) > TEXT_CACHE_SIZE:
+            _text_cache.popitem(last=False)
+    else:
+        _text_cache.move_to_end(key)
+    return surface
+
+def show_menu(screen, items, escape_quits=False):
+    """
+    Muestra una pantalla fija de texto sobre fondo negro hasta que se pulsa
+    Enter. Cerrar la ventana (o pulsar Esc, si 'escape_quits') sale del juego.
+    items: lista de (superficie, posición o rect) a dibujar.
+
+    La pantalla se dibuja una sola vez. El bucle duerme en
+    pygame.event.wait hasta que llega un evento y, como mucho, itera
+    MENU_FPS veces por segundo. Solo se vuelve a presentar (con
+    display.update de las zonas sucias) si la ventana pide repintarse.
+    """
+    screen.fill(BLACK)
+    for surface, rect in items:
+        screen.blit(surface, rect)
+    dirty = [screen.get_rect()]
+    clock = pygame.time.Clock()
+    while True:
+        if dirty:
+            pygame.display.update(dirty)
+            dirty = []
+        for event in [pygame.event.wait()] + pygame.event.get():
+            if event.type == pygame.QUIT or (
+                    escape_quits and event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                pygame.quit()
+                sys.exit()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
+                return
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                dirty = [screen.get_rect()]
+        clock.tick(MENU_FPS)
+
+def message_screen(screen, message_lines, option_lines, size=30, color=(255, 255, 255)):
+    """
+    Pantalla de mensaje (victoria o Game Over): las líneas del mensaje y,
+    20 píxeles más abajo, las de las opciones, todo centrado. Enter vuelve;
+    Esc o cerrar la ventana salen del juego.
+    """
+    font = get_font(size)
+    line_height = font.get_linesize()
+    total_height = (len(message_lines) + len(option_lines)) * line_height + 20  # 20 píxeles de margen entre grupos
+    start_y = (screen.get_height() - total_height) // 2
+    rows = [(line, start_y + i * line_height) for i, line in enumerate(message_lines)]
+    offset = start_y + len(message_lines) * line_height + 20
+    rows += [(line, offset + i * line_height) for i, line in enumerate(option_lines)]
+
+    items = []
+    for line, y in rows:
+        surface = render_text(font, line, color)
+        items.append((surface, surface.get_rect(center=(screen.get_width() // 2, y))))
+    show_menu(screen, items, escape_quits=True)
+
 def win_screen(screen):
     """
     Muestra la pantalla de victoria.
@@ -65,79 +225,38 @@ def win_screen(screen):
       
     El texto se centra en pantalla para evitar que se corte.
     """
-    # Usamos una fuente adecuada para que todo el texto quepa sin problemas
-    font = pygame.font.SysFont("Arial", 30)
-    text_color = (255, 255, 255)
-    
-    win_lines = [
-        "Saliste del universo de ENTropia,",
-        "felicidades, supongo..."
-    ]
-    option_lines = [
-        "Presiona Esc para salir",
-        "o Enter para la pantalla de inicio"
-    ]
-    
-    # Calcula el espaciado total para centrar verticalmente
-    line_height = font.get_linesize()
-    total_lines = len(win_lines) + len(option_lines)
-    total_height = total_lines * line_height + 20  # 20 píxeles de margen extra entre grupos
-    start_y = (screen.get_height() - total_height) // 2
-
-    while True:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    pygame.quit()
-                    sys.exit()
-                elif event.key == pygame.K_RETURN:
-                    return  # Al pulsar Enter, se regresa (por ejemplo, para volver a la pantalla de inicio)
-        
-        # Rellena la pantalla con negro
-        screen.fill((0, 0, 0))
-        
-        # Dibuja las líneas de mensaje de victoria
-        for i, line in enumerate(win_lines):
-            surface = font.render(line, True, text_color)
-            rect = surface.get_rect(center=(screen.get_width() // 2, start_y + i * line_height))
-            screen.blit(surface, rect)
-        
-        # Desplaza hacia abajo para dibujar las opciones de control
-        offset = len(win_lines) * line_height + 20
-        for i, line in enumerate(option_lines):
-            surface = font.render(line, True, text_color)
-            rect = surface.get_rect(center=(screen.get_width() // 2, start_y + offset + i * line_height))
-            screen.blit(surface, rect)
-        
-        pygame.display.flip()
-        pygame.time.delay(100)
+    message_screen(screen,
+                   ["Saliste del universo de ENTropia,",
+                    "felicidades, supongo..."],
+                   ["Presiona Esc para salir",
+                    "o Enter para la pantalla de inicio"])
 
 
-def place_caliz():
+def place_caliz(level, rng=random):
     """
-    Coloca el objeto 'caliz' en una posición aleatoria del mapa.
+    Coloca el objeto 'caliz' en una posición aleatoria del mapa 'level'.
     Se selecciona una celda aleatoria; si esa celda no es un muro,
     se retorna un diccionario con las coordenadas centradas en la celda.
+    'rng' es el generador aleatorio a usar (por defecto, el módulo random).
     """
     while True:
-        celda_x = random.randint(0, MAP_WIDTH - 1)
-        celda_y = random.randint(0, MAP_HEIGHT - 1)
-        if game_map[celda_y][celda_x] != "1":  # Suponiendo que "1" es muro
+        celda_x = rng.randint(0, level.width - 1)
+        celda_y = rng.randint(0, level.height - 1)
+        if not level.is_wall(celda_x, celda_y):
             return {"x": celda_x + 0.5, "y": celda_y + 0.5}
 
-def draw_caliz(screen, caliz, scale=6):
+def draw_caliz(screen, caliz, scale=6, origin=(0, 0)):
     """
     Dibuja el objeto 'caliz' en la pantalla.
     
     Se representa como un cuadrado azul centrado en (caliz["x"], caliz["y"]).
     El tamaño en píxeles se calcula multiplicando CALIZ_SIZE por el factor scale.
+    'origin' es la celda del mapa que corresponde a la esquina superior izquierda
+    (la del minimapa cuando solo se muestra una ventana del laberinto).
     """
     # Convierte las coordenadas del mundo a píxeles
-    caliz_screen_x = int(caliz["x"] * scale)
-    caliz_screen_y = int(caliz["y"] * scale)
+    caliz_screen_x = int((caliz["x"] - origin[0]) * scale)
+    caliz_screen_y = int((caliz["y"] - origin[1]) * scale)
     # Calcula el tamaño en píxeles
     caliz_tamaño = int(CALIZ_SIZE * scale)
     # Crea el rectángulo centrado
@@ -156,56 +275,11 @@ def game_over_screen(screen):
     Se muestran dos líneas para el mensaje de Game Over y dos líneas con las opciones,
     de modo que todo el texto quepa en la pantalla.
     """
-    # Usamos una fuente suficientemente pequeña para que tepa quepan ambas líneas
-    font = pygame.font.SysFont("Arial", 30)
-    text_color = (255, 255, 255)
-    
-    # Dividimos el mensaje en dos líneas y también las opciones en dos líneas
-    game_over_lines = [
-        "El universo de ENTropia te ha absorbido,",
-        "ahora eres parte de él"
-    ]
-    option_lines = [
-        "Presiona Esc para salir",
-        "o Enter para la pantalla de inicio"
-    ]
-    
-    # Calculamos el espaciado vertical total
-    line_height = font.get_linesize()
-    total_lines = len(game_over_lines) + len(option_lines)
-    total_height = total_lines * line_height + 20  # 20 píxeles de margen entre grupos
-    
-    start_y = (screen.get_height() - total_height) // 2
-    
-    while True:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    pygame.quit()
-                    sys.exit()
-                elif event.key == pygame.K_RETURN:
-                    return  # Al pulsar Enter se termina esta pantalla
-        
-        screen.fill((0, 0, 0))
-        
-        # Renderizamos las líneas del mensaje de Game Over
-        for i, line in enumerate(game_over_lines):
-            surface = font.render(line, True, text_color)
-            rect = surface.get_rect(center=(screen.get_width() // 2, start_y + i * line_height))
-            screen.blit(surface, rect)
-        
-        # Renderizamos las líneas con las opciones, con un offset adicional
-        offset = len(game_over_lines) * line_height + 20
-        for i, line in enumerate(option_lines):
-            surface = font.render(line, True, text_color)
-            rect = surface.get_rect(center=(screen.get_width() // 2, start_y + offset + i * line_height))
-            screen.blit(surface, rect)
-        
-        pygame.display.flip()
-        pygame.time.delay(100)
+    message_screen(screen,
+                   ["El universo de ENTropia te ha absorbido,",
+                    "ahora eres parte de él"],
+                   ["Presiona Esc para salir",
+                    "o Enter para la pantalla de inicio"])
 
 
 
@@ -228,68 +302,78 @@ def draw_lives(screen, lives, square_size=20, gap=10, margin=10):
         pygame.draw.rect(screen, RED, (x, y, square_size, square_size))
 
 
-def transition_effect(screen, duration_ms=4000):
+class ScreenTransition:
     """
-    Realiza un efecto de transición en la pantalla con fade-out y fade-in, 
-    reduciendo y luego restaurando el volumen de la música al mismo tiempo.
+    Fundido a negro desde la pantalla de inicio y fundido desde negro sobre
+    los fotogramas reales del juego, con la música siguiendo al fundido.
+
+    No bloquea: el bucle principal llama a update(dt) con el tiempo de su
+    reloj y sigue atendiendo eventos, así que la ventana responde en todo
+    momento. El velo negro y la captura de la pantalla de inicio son dos
+    superficies que se crean una vez y se reutilizan; la opacidad del velo
+    se cambia con set_alpha en lugar de crear una superficie por paso.
     duration_ms: duración en milisegundos de cada fase (fade-out y fade-in)
     """
-    steps = 60  # Puedes aumentar este valor para un efecto más suave.
-    delay = duration_ms / steps / 1000.0  # Tiempo entre pasos (en segundos)
-    original_volume = pygame.mixer.music.get_volume()
-    
-    # Captura de la pantalla actual (por ejemplo, la pantalla de inicio)
-    snapshot = screen.copy()
-    
-    # FADE-OUT: aumentar gradualmente la opacidad del overlay negro
-    for i in range(steps):
-        alpha = int(i / steps * 255)
-        new_volume = original_volume * (1 - i / steps)
-        pygame.mixer.music.set_volume(new_volume)
-        
-        # Primera fase: dibuja la imagen actual (capturada)
-        screen.blit(snapshot, (0, 0))
-        
-        # Crea un overlay negro con canal alpha
-        overlay = pygame.Surface(screen.get_size(), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, alpha))
-        screen.blit(overlay, (0, 0))
-        
-        pygame.display.flip()
-        pygame.time.delay(int(delay * 1000))
-    
-    # Aquí la pantalla está casi completamente negra y el audio casi silenciado.
-    # Podrías agregar un breve "hold" si lo consideras necesario.
-    
-    # FADE-IN: suponiendo que en este punto se va a mostrar la escena del juego.
-    # Preparamos la nueva escena. Se recomienda capturarla o, si se va a redibujar,
-    # realizar el dibujo correspondiente antes del efecto.
-    # Para este ejemplo, simularemos un fondo gris (puedes sustituirlo por tu escena).
-    new_scene = pygame.Surface(screen.get_size())
-    new_scene.fill((50, 50, 50))  # Fondo gris de ejemplo
-    
-    for i in range(steps):
-        alpha = int((1 - i / steps) * 255)
-        new_volume = original_volume * (i / steps)
-        pygame.mixer.music.set_volume(new_volume)
-        
-        # Dibuja la nueva escena
-        screen.blit(new_scene, (0, 0))
-        # Crea nuevamente el overlay, pero ahora con opacidad decreciente
-        overlay = pygame.Surface(screen.get_size(), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, alpha))
-        screen.blit(overlay, (0, 0))
-        
-        pygame.display.flip()
-        pygame.time.delay(int(delay * 1000))
-    
-    # Finalmente, se restablece el volumen original
-    pygame.mixer.music.set_volume(original_volume)
+
+    def __init__(self, duration_ms=4000):
+        self.duration = duration_ms / 1000.0
+        self.phase = None  # None (inactiva), "out" (a negro) o "in" (desde negro)
+        self.elapsed = 0.0
+        self.overlay = None
+        self.snapshot = None
+        self.volume = None  # Volumen original de la música (None sin audio)
+
+    @property
+    def active(self):
+        return self.phase is not None
+
+    def start(self, screen):
+        """Empieza el fundido a negro desde lo que muestra ahora la pantalla."""
+        size = screen.get_size()
+        if self.overlay is None or self.overlay.get_size() != size:
+            self.overlay = pygame.Surface(size)
+            self.overlay.fill(BLACK)
+            self.snapshot = pygame.Surface(size)
+        self.snapshot.blit(screen, (0, 0))
+        self.volume = pygame.mixer.music.get_volume() if init_mixer() else None
+        self.phase = "out"
+        self.elapsed = 0.0
+
+    def darkness(self):
+        """Opacidad actual del velo negro, entre 0 y 1."""
+        progress = min(1.0, self.elapsed / self.duration)
+        return progress if self.phase == "out" else 1.0 - progress
+
+    def update(self, dt):
+        """Avanza el fundido 'dt' segundos y ajusta el volumen de la música."""
+        self.elapsed += dt
+        if self.elapsed >= self.duration:
+            if self.phase == "out":
+                self.phase = "in"
+                self.elapsed = 0.0
+            else:
+                self.phase = None
+        if self.volume is not None:
+            level = self.darkness() if self.active else 0.0
+            pygame.mixer.music.set_volume(self.volume * (1.0 - level))
+
+    def draw(self, screen):
+        """
+        Oscurece la pantalla según la fase. En el fundido a negro se parte de
+        la captura de la pantalla de inicio; en el fundido desde negro, de lo
+        que ya se haya dibujado (el fotograma del juego).
+        """
+        if self.phase == "out":
+            screen.blit(self.snapshot, (0, 0))
+        self.overlay.set_alpha(int(self.darkness() * 255))
+        screen.blit(self.overlay, (0, 0))
+
+transition = ScreenTransition()
 
 def play_background_music():
     # Asegurarse de que el mezclador esté inicializado
-    if not pygame.mixer.get_init():
-        pygame.mixer.init()
+    if not init_mixer():
+        return
     try:
         # Carga el archivo de audio (asegúrate de que el nombre y la extensión coincidan)
         pygame.mixer.music.load("Metamorphosis One.mp3")
@@ -302,86 +386,1207 @@ def play_background_music():
 
 
 def start_screen(screen):
-    font_title = pygame.font.SysFont("Arial", 60)
-    font_instructions = pygame.font.SysFont("Arial", 30)
-    waiting = True
-    while waiting:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            elif event.type == pygame.KEYDOWN:
-                # Puedes especificar que solo se avance con ENTER o cualquier otra tecla:
-                if event.key == pygame.K_RETURN:
-                    waiting = False
+    # Título e instrucciones centrados; se avanza con ENTER
+    title_text = render_text(get_font(60), "ENTropia 3D", WHITE)
+    instructions_text = render_text(get_font(30), "KXdw wvd2B 3D1 LH7JRO SRTYFFHW p", WHITE)
+    show_menu(screen, [(title_text, ((WIDTH - title_text.get_width()) // 2, HEIGHT // 3)),
+                       (instructions_text, ((WIDTH - instructions_text.get_width()) // 2, HEIGHT // 2))])
 
-        # Rellena la pantalla con un color de fondo (por ejemplo, negro)
-        screen.fill(BLACK)
 
-        # Renderiza el título y las instrucciones
-        title_text = font_title.render("ENTropia 3D", True, WHITE)
-        instructions_text = font_instructions.render("KXdw wvd2B 3D1 LH7JRO SRTYFFHW p", True, WHITE)
+def generate_maze(width, height, seed=None):
+    """
+    Genera un laberinto aleatorio usando backtracking con una pila explícita,
+    por lo que no depende del límite de recursión de Python y admite mapas de
+    miles de celdas por lado. Con la misma semilla se obtiene el mismo laberinto.
+    Devuelve un array uint8 de forma (height, width) donde cada celda es
+    WALL_CELL (muro) u OPEN_CELL (pasillo). Ambas dimensiones deben ser impares.
+    """
+    if width < 3 or height < 3 or width % 2 == 0 or height % 2 == 0:
+        raise ValueError(f"Las dimensiones del laberinto deben ser impares y >= 3 (recibido {width}x{height})")
+    rng = random.Random(seed)
+    rand = rng.random
+
+    # Se trabaja sobre bytearrays planos: el acceso escalar es mucho más barato
+    # que indexar un array de NumPy.
+    maze = bytearray([WALL_CELL]) * (width * height)
+
+    # 'pending' marca las celdas de coordenadas impares que aún no se han
+    # visitado. Lleva dos filas de relleno arriba y abajo para no comprobar
+    # límites, y al ser el ancho impar los vecinos que se salen por un lateral
+    # caen en columnas pares, que nunca están pendientes.
+    pad = 2 * width
+    pending = np.zeros((height + 4, width), dtype=np.uint8)
+    pending[3:-3:2, 1:-1:2] = 1
+    pending = bytearray(pending.tobytes())
+
+    # Como en el backtracking recursivo, cada celda recorre las cuatro
+    # direcciones en un orden aleatorio. Cada entrada de la pila codifica en un
+    # solo entero la celda, el orden elegido y la siguiente dirección a probar:
+    # celda * 128 + orden * 4 + dirección.
+    orders = list(itertools.permutations((1, -1, width, -width)))
+    start = width + 1  # Celda (1, 1)
+    maze[start] = OPEN_CELL
+    pending[start + pad] = 0
+    stack = [start * 128 + int(rand() * 24) * 4]
+    while stack:
+        state = stack[-1]
+        cell = state >> 7
+        order = orders[(state >> 2) & 31]
+        for k in range(state & 3, 4):
+            d = order[k]
+            nxt = cell + 2 * d
+            if pending[nxt + pad]:
+                maze[cell + d] = OPEN_CELL  # Abre el muro intermedio
+                maze[nxt] = OPEN_CELL
+                pending[nxt + pad] = 0
+                if k < 3:
+                    stack[-1] = state - (state & 3) + k + 1
+                else:
+                    stack.pop()
+                stack.append(nxt * 128 + int(rand() * 24) * 4)
+                break
+        else:
+            stack.pop()
 
-        # Centra el título y el mensaje en la pantalla
-        screen.blit(title_text, ((WIDTH - title_text.get_width()) // 2, HEIGHT // 3))
-        screen.blit(instructions_text, ((WIDTH - instructions_text.get_width()) // 2, HEIGHT // 2))
+    return np.frombuffer(maze, dtype=np.uint8).reshape(height, width)
 
-        # Actualiza la pantalla
-        pygame.display.flip()
+def benchmark_maze_generation(sizes=((91, 81), (251, 251), (501, 501), (1001, 1001), (2001, 2001)), seed=0):
+    """
+    Mide generate_maze para cada tamaño y lo muestra en una tabla. El tiempo
+    se toma sin tracemalloc (que ralentiza mucho el bucle) y el pico de
+    memoria en una segunda pasada con la misma semilla.
+    """
+    import tracemalloc
+
+    print(f"{'tamaño':>11} {'celdas':>10} {'tiempo (s)':>11} {'pico (MB)':>10} {'mapa (MB)':>10}")
+    for width, height in sizes:
+        start = time.perf_counter()
+        maze = generate_maze(width, height, seed)
+        elapsed = time.perf_counter() - start
 
+        tracemalloc.start()
+        generate_maze(width, height, seed)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{width:>5}x{height:<5} {width * height:>10} {elapsed:>11.3f} "
+              f"{peak / 2**20:>10.2f} {maze.nbytes / 2**20:>10.2f}")
 
-def generate_maze(width, height):
+# =====================================================
+# A2. REPRESENTACIÓN DEL MAPA
+# =====================================================
+# Cada mapa es un GameMap: sus celdas (un array uint8 de alto x ancho, 1 byte
+# por celda, o un ChunkedMap en disco), sus dimensiones y las cachés que
+# dependen de él. Cada GameState tiene el suyo y la simulación lo consulta con
+# sus métodos is_wall (consulta escalar) y walls_at (consulta por lotes). El
+# renderizado y las herramientas usan el mapa instalado con set_game_map, a
+# través de las funciones de este apartado.
+
+class GameMap:
     """
-    Genera un laberinto aleatorio usando backtracking recursivo.
-    Cada celda es '1' (muro) o ' ' (pasillo).
+    Un mapa y lo que depende de él: las celdas (un array uint8 en memoria o
+    un ChunkedMap en disco), sus dimensiones, la caché de líneas de visión
+    hacia el jugador y el PVS. Cada GameState tiene el suyo, así que en un
+    mismo proceso pueden convivir partidas con mapas distintos. Lo que queda
+    fuera del mapa cuenta como muro.
     """
-    maze = [['1' for _ in range(width)] for _ in range(height)]
-    
-    def carve(x, y):
-        maze[y][x] = ' '  # Marca la celda actual como pasillo
-        directions = [(2, 0), (-2, 0), (0, 2), (0, -2)]
-        random.shuffle(directions)
-        for dx, dy in directions:
-            nx, ny = x + dx, y + dy
-            if 1 <= nx < width - 1 and 1 <= ny < height - 1 and maze[ny][nx] == '1':
-                maze[y + dy // 2][x + dx // 2] = ' '  # Abre el muro intermedio
-                carve(nx, ny)
-    
-    carve(1, 1)
-    return ["".join(row) for row in maze]
 
-game_map = generate_maze(MAZE_WIDTH, MAZE_HEIGHT)
-MAP_WIDTH = len(game_map[0])
-MAP_HEIGHT = len(game_map)
+    def __init__(self, cells):
+        if isinstance(cells, ChunkedMap):
+            self.cells = None
+            self.chunked = cells
+            self.width, self.height = cells.width, cells.height
+            self._flat = None
+        else:
+            self.cells = np.ascontiguousarray(cells, dtype=np.uint8)
+            self.chunked = None
+            self.height, self.width = self.cells.shape
+            # Las consultas escalares indexan una memoryview plana del mismo
+            # buffer, que devuelve enteros de Python sin pasar por NumPy
+            self._flat = memoryview(self.cells.reshape(-1))
+        self.pvs = None  # None mientras no esté calculado o si no merece la pena
+        self.pvs_requested = False
+        # Caché de visibilidad: celda del enemigo -> ¿ve al jugador? Solo es
+        # válida mientras el jugador siga en la celda los_owner, así que la
+        # clave efectiva es (celda del enemigo, celda del jugador).
+        self.los_cache = {}
+        self.los_owner = None
+
+    def is_wall(self, x, y):
+        """
+        Indica si el punto (x, y) del mundo (o la celda de índices enteros x, y)
+        está dentro de un muro.
+        """
+        xi = int(x)
+        yi = int(y)
+        if 0 <= xi < self.width and 0 <= yi < self.height:
+            if self.chunked is not None:
+                return self.chunked.cell(xi, yi) == WALL_CELL
+            return self._flat[yi * self.width + xi] == WALL_CELL
+        return True
 
-# Se utiliza un z-buffer global para almacenar la distancia de cada rayo.
-z_buffer = [0.0 for _ in range(NUM_RAYS)]
+    def walls_at(self, xs, ys):
+        """
+        Versión por lotes de is_wall: recibe arrays de coordenadas (reales o
+        enteras) y devuelve un array booleano.
+        """
+        xi = np.asarray(xs).astype(np.intp)
+        yi = np.asarray(ys).astype(np.intp)
+        inside = (xi >= 0) & (xi < self.width) & (yi >= 0) & (yi < self.height)
+        result = ~inside
+        if self.chunked is not None:
+            result[inside] = self.chunked.cells_at(xi[inside], yi[inside]) == WALL_CELL
+        else:
+            result[inside] = self.cells[yi[inside], xi[inside]] == WALL_CELL
+        return result
+
+    def region(self, x0, y0, x1, y1):
+        """Celdas del rectángulo [x0, x1) x [y0, y1) (sin salirse de los límites del mapa)."""
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = max(x0, min(self.width, x1)), max(y0, min(self.height, y1))
+        if self.chunked is not None:
+            return self.chunked.region(x0, y0, x1, y1)
+        return self.cells[y0:y1, x0:x1]
+
+    def los_cache_for(self, px, py):
+        """Devuelve la caché de visibilidad, vaciándola si el jugador (en px, py) ha cambiado de celda."""
+        owner = (int(px), int(py))
+        if owner != self.los_owner:
+            self.los_cache.clear()
+            self.los_owner = owner
+        return self.los_cache
+
+MAP_VERSION = 0  # Cambia cada vez que se instala un mapa nuevo (invalida las cachés)
+# Sin mapa hasta el primer uso (ensure_game_map) o hasta que se instale uno
+current_map = None
+game_map = None  # Celdas del mapa instalado (None si es un mundo troceado)
+MAP_WIDTH = MAP_HEIGHT = 0
+
+def set_game_map(maze):
+    """
+    Instala como mapa actual 'maze' (un array, un ChunkedMap o un GameMap) y
+    actualiza sus dimensiones. Devuelve el GameMap instalado.
+    """
+    global current_map, game_map, MAP_WIDTH, MAP_HEIGHT, MAP_VERSION
+    level = maze if isinstance(maze, GameMap) else GameMap(maze)
+    if level is not current_map:
+        MAP_VERSION += 1
+        current_map = level
+        game_map = level.cells
+        MAP_WIDTH, MAP_HEIGHT = level.width, level.height
+    return level
+
+def is_wall(x, y):
+    """Como GameMap.is_wall, en el mapa instalado."""
+    return current_map.is_wall(x, y)
+
+def walls_at(xs, ys):
+    """Como GameMap.walls_at, en el mapa instalado."""
+    return current_map.walls_at(xs, ys)
+
+def map_region(x0, y0, x1, y1):
+    """Como GameMap.region, en el mapa instalado."""
+    return current_map.region(x0, y0, x1, y1)
+
+def ensure_game_map():
+    """Genera e instala el laberinto (MAZE_WIDTH x MAZE_HEIGHT, MAZE_SEED) si aún no hay mapa; lo devuelve."""
+    if current_map is None:
+        start = time.perf_counter()
+        set_game_map(generate_maze(MAZE_WIDTH, MAZE_HEIGHT, MAZE_SEED))
+        STARTUP_TIMES["maze"] = time.perf_counter() - start
+    return game_map
+
+# Mundos muy grandes (decenas de miles de celdas por lado): el mapa no se
+# carga entero sino que vive en un fichero binario troceado en bloques de
+# MAP_CHUNK x MAP_CHUNK celdas, que se proyecta en memoria (mmap) y del que
+# solo se copian los bloques que se consultan. Los bloques residentes forman
+# una LRU de MAP_RESIDENT_CHUNKS entradas y las páginas proyectadas se sueltan
+# tras copiar cada bloque, así que la memoria usada no depende del tamaño del
+# mundo. Los métodos de GameMap (is_wall, walls_at, region) siguen siendo la
+# única forma de consultar el mapa y eligen solos el almacenamiento.
+
+MAP_CHUNK = 64              # Lado de cada bloque en celdas (potencia de 2)
+MAP_RESIDENT_CHUNKS = 256   # Bloques que se conservan en memoria (4 KB cada uno)
+WORLD_FILE_MAGIC = b"ENTMAP01"
+WORLD_HEADER = np.dtype([("magic", "S8"), ("width", "<i8"), ("height", "<i8"), ("chunk", "<i8"), ("seed", "<i8")])
+WORLD_HEADER_SIZE = 4096    # La cabecera ocupa una página: los bloques quedan alineados
+MAP_RELEASE_BYTES = 2 << 20  # Tramo alineado de páginas proyectadas que se suelta tras leer un bloque
+
+class ChunkedMap:
+    """
+    Mapa guardado en un fichero por bloques: una cabecera (WORLD_HEADER,
+    rellena hasta WORLD_HEADER_SIZE bytes) y después los bloques por filas,
+    cada uno con sus MAP_CHUNK x MAP_CHUNK celdas contiguas, de modo que
+    cargar un bloque es leer un tramo seguido del fichero. Lo que queda fuera
+    del ancho y el alto reales es muro. Cada consulta cambia la LRU y la
+    ventana, así que se consulta desde un solo hilo, como el resto del mapa.
+    """
+
+    def __init__(self, path, capacity=MAP_RESIDENT_CHUNKS):
+        header = np.fromfile(path, dtype=WORLD_HEADER, count=1)
+        if header.size != 1 or header["magic"][0] != WORLD_FILE_MAGIC:
+            raise ValueError(f"{path} no es un fichero de mundo")
+        self.path = path
+        self.width = int(header["width"][0])
+        self.height = int(header["height"][0])
+        self.chunk = int(header["chunk"][0])
+        self.seed = int(header["seed"][0])  # -1 si se generó sin semilla
+        self.shift = self.chunk.bit_length() - 1
+        self.chunks_x = -(-self.width // self.chunk)
+        self.chunks_y = -(-self.height // self.chunk)
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        block_size = self.chunk * self.chunk
+        self.blocks = np.frombuffer(self._mmap, dtype=np.uint8, offset=WORLD_HEADER_SIZE,
+                                    count=self.chunks_y * self.chunks_x * block_size)
+        self.blocks = self.blocks.reshape(self.chunks_y, self.chunks_x, self.chunk, self.chunk)
+        self._release = (hasattr(self._mmap, "madvise") and hasattr(mmap, "MADV_DONTNEED")
+                         and MAP_RELEASE_BYTES % mmap.PAGESIZE == 0)
+        self.capacity = capacity
+        self.resident = collections.OrderedDict()  # (bx, by) -> (array, memoryview plana)
+        self.loads = 0
+        self._last_key = None
+        self._last = None
+        self.window = np.zeros((0, 0), dtype=np.uint8)
+        self.window_x = self.window_y = 0
+
+    def load(self, bx, by):
+        """Devuelve el bloque (bx, by) como (array, memoryview plana), leyéndolo del fichero si no está residente."""
+        key = (bx, by)
+        block = self.resident.get(key)
+        if block is None:
+            cells = np.array(self.blocks[by, bx])
+            if self._release:
+                # El bloque ya está copiado: se sueltan sus páginas proyectadas. El
+                # núcleo proyecta de una vez las vecinas (hasta una página enorme
+                # de 2 MB), así que se suelta todo el tramo alineado que lo contiene
+                offset = WORLD_HEADER_SIZE + (by * self.chunks_x + bx) * cells.size
+                start = offset - offset % MAP_RELEASE_BYTES
+                self._mmap.madvise(mmap.MADV_DONTNEED, start, min(MAP_RELEASE_BYTES, len(self._mmap) - start))
+            block = self.resident[key] = (cells, memoryview(cells.reshape(-1)))
+            self.loads += 1
+            if len(self.resident) > self.capacity:
+                self.resident.popitem(last=False)
+        else:
+            self.resident.move_to_end(key)
+        return block
+
+    def cell(self, xi, yi):
+        """Valor de la celda (xi, yi), que debe estar dentro del mapa."""
+        key = (xi >> self.shift, yi >> self.shift)
+        if key != self._last_key:
+            # Las consultas seguidas suelen caer en el mismo bloque
+            self._last = self.load(*key)[1]
+            self._last_key = key
+        mask = self.chunk - 1
+        return self._last[(yi & mask) * self.chunk + (xi & mask)]
+
+    def cells_at(self, xi, yi):
+        """
+        Versión por lotes de cell para arrays 1-D de índices enteros dentro
+        del mapa. Se resuelven primero en una ventana de 3 x 3 bloques ya
+        ensamblada, que se recoloca alrededor del primer punto cuando ninguno
+        cae dentro; los que quedan fuera se buscan bloque a bloque.
+        """
+        wx = xi - self.window_x
+        wy = yi - self.window_y
+        height, width = self.window.shape
+        inside = (wx >= 0) & (wx < width) & (wy >= 0) & (wy < height)
+        if xi.size and not inside.any():
+            self._place_window(int(xi[0]), int(yi[0]))
+            return self.cells_at(xi, yi)
+        if inside.all():
+            return self.window[wy, wx]
+        result = np.empty(xi.size, dtype=np.uint8)
+        result[inside] = self.window[wy[inside], wx[inside]]
+        outside = ~inside
+        xi = xi[outside]
+        yi = yi[outside]
+        keys = (yi >> self.shift) * self.chunks_x + (xi >> self.shift)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        blocks = np.stack([self.load(key % self.chunks_x, key // self.chunks_x)[0] for key in unique.tolist()])
+        mask = self.chunk - 1
+        result[outside] = blocks[inverse.reshape(-1), yi & mask, xi & mask]
+        return result
+
+    def _place_window(self, x, y):
+        left = max(0, ((x >> self.shift) - 1) * self.chunk)
+        top = max(0, ((y >> self.shift) - 1) * self.chunk)
+        self.window = self.region(left, top, min(self.width, left + 3 * self.chunk),
+                                  min(self.height, top + 3 * self.chunk))
+        self.window_x = left
+        self.window_y = top
+
+    def region(self, x0, y0, x1, y1):
+        """Copia de las celdas del rectángulo [x0, x1) x [y0, y1), que debe estar dentro del mapa."""
+        out = np.empty((y1 - y0, x1 - x0), dtype=np.uint8)
+        for by in range(y0 >> self.shift, ((y1 - 1) >> self.shift) + 1):
+            for bx in range(x0 >> self.shift, ((x1 - 1) >> self.shift) + 1):
+                cells = self.load(bx, by)[0]
+                top = by * self.chunk
+                left = bx * self.chunk
+                ya, yb = max(y0, top), min(y1, top + self.chunk)
+                xa, xb = max(x0, left), min(x1, left + self.chunk)
+                out[ya - y0:yb - y0, xa - x0:xb - x0] = cells[ya - top:yb - top, xa - left:xb - left]
+        return out
+
+def generate_world(path, width, height, seed=None, chunk=MAP_CHUNK):
+    """
+    Genera un laberinto perfecto de width x height (impares) directamente en
+    el fichero de bloques 'path', por bandas de 'chunk' filas, con el
+    algoritmo sidewinder: en cada fila de celdas se abren tramos horizontales
+    al azar y cada tramo se une por una de sus celdas con la fila de arriba.
+    Cada fila solo depende de números aleatorios propios, así que la banda
+    entera se calcula con NumPy y la memoria usada es la de una banda, no la
+    del mundo. La primera fila queda como un pasillo recto.
+    """
+    rng = np.random.default_rng(seed)
+    cells_w = (width - 1) // 2
+    cells_h = (height - 1) // 2
+    chunks_x = -(-width // chunk)
+    chunks_y = -(-height // chunk)
+    header = np.array([(WORLD_FILE_MAGIC, width, height, chunk, -1 if seed is None else seed)], dtype=WORLD_HEADER)
+    with open(path, "wb") as f:
+        f.write(header.tobytes().ljust(WORLD_HEADER_SIZE, b"\0"))
+        _write_world_bands(f, rng, cells_w, cells_h, chunks_x, chunks_y, chunk)
+    return ChunkedMap(path)
+
+def _write_world_bands(f, rng, cells_w, cells_h, chunks_x, chunks_y, chunk):
+    # Las bandas se escriben en orden y cada una es una fila completa de
+    # bloques, así que el fichero se escribe de forma secuencial
+    rows_per_band = chunk // 2  # La fila de celdas r ocupa las filas 2r (paso al norte) y 2r + 1 del mapa
+    for band in range(chunks_y):
+        first = band * rows_per_band
+        rows = max(0, min(rows_per_band, cells_h - first))
+        tiles = np.full((chunk, chunks_x * chunk), WALL_CELL, dtype=np.uint8)
+        if rows:
+            east = rng.random((rows, cells_w)) < 0.5
+            east[:, -1] = False
+            if first == 0:
+                east[0, :-1] = True
+            # Cada tramo acaba en la primera celda sin paso al este (las filas
+            # siempre acaban así) y sube al norte por una celda elegida al azar
+            ends = np.flatnonzero(~east)
+            starts = np.concatenate(([0], ends[:-1] + 1))
+            north = np.zeros(rows * cells_w, dtype=bool)
+            north[starts + (rng.random(ends.size) * (ends - starts + 1)).astype(np.intp)] = True
+            north = north.reshape(rows, cells_w)
+            if first == 0:
+                north[0] = False
+            tiles[1:2 * rows:2, 1:2 * cells_w:2] = OPEN_CELL
+            tiles[1:2 * rows:2, 2:2 * cells_w + 1:2][east] = OPEN_CELL
+            tiles[0:2 * rows:2, 1:2 * cells_w:2][north] = OPEN_CELL
+        f.write(tiles.reshape(chunk, chunks_x, chunk).transpose(1, 0, 2).tobytes())
+
+def open_world(width, height, seed=None, path=None):
+    """
+    Abre el mundo troceado de width x height y semilla 'seed' guardado en
+    'path' (por defecto, en la carpeta temporal con esos datos en el nombre)
+    o lo genera si el fichero no existe o no corresponde. Sin semilla se
+    genera siempre uno nuevo, salvo que se indique un fichero existente del
+    mismo tamaño.
+    """
+    explicit = path is not None
+    if not explicit:
+        path = os.path.join(tempfile.gettempdir(), f"entropia_world_{width}x{height}_{seed}.map")
+    if seed is not None or explicit:
+        try:
+            world_map = ChunkedMap(path)
+            if ((world_map.width, world_map.height, world_map.chunk) == (width, height, MAP_CHUNK)
+                    and (seed is None or world_map.seed == seed)):
+                return world_map
+        except (OSError, ValueError):
+            pass
+    return generate_world(path, width, height, seed)
+
+def set_fov(fov):
+    """Cambia el campo de visión (en radianes) y las constantes que dependen de él."""
+    global FOV, HALF_FOV, DELTA_ANGLE
+    FOV = fov
+    HALF_FOV = FOV / 2
+    DELTA_ANGLE = FOV / NUM_RAYS
+
+def configure_rays(num_rays):
+    """
+    Fija el número de rayos proyectados y recalcula todo lo que depende de él:
+    el ángulo entre rayos, el ancho de columna, el z-buffer y el framebuffer.
+    Con num_rays == WIDTH se proyecta un rayo por columna de píxeles.
+    """
+    global NUM_RAYS, DELTA_ANGLE, SCALE, z_buffer, wall_u, wall_side, RAY_IDS, frame_surface, _span_mask
+    NUM_RAYS = num_rays
+    DELTA_ANGLE = FOV / NUM_RAYS
+    SCALE = WIDTH / NUM_RAYS
+    # Se utiliza un z-buffer global (preasignado) para almacenar la distancia de cada rayo.
+    z_buffer = np.zeros(NUM_RAYS)
+    # Punto de impacto de cada rayo para las texturas: posición a lo largo
+    # del muro (0-1) y lado (0 = borde vertical, 1 = horizontal)
+    wall_u = np.zeros(NUM_RAYS)
+    wall_side = np.zeros(NUM_RAYS, dtype=np.int8)
+    RAY_IDS = np.arange(NUM_RAYS)
+    # Framebuffer de 32 bits (0xRRGGBB) con una columna de píxeles por rayo. Los
+    # muros se escriben en él a través de una vista NumPy y se vuelca a la
+    # pantalla con un único blit (escalado a WIDTH si hay menos rayos que columnas).
+    # La superficie se crea al dibujar el primer fotograma con estos rayos.
+    frame_surface = None
+    _span_mask = np.zeros((HEIGHT, NUM_RAYS), dtype=bool)
+
+configure_rays(NUM_RAYS)
+
+class Camera:
+    """
+    Modelo de cámara con tablas precalculadas que solo dependen del FOV, de
+    NUM_RAYS y del tamaño de la ventana; se reconstruyen solas (en sync) cuando
+    cambia alguno de ellos.
+
+    - plane: tangente del desfase angular de cada columna respecto al centro.
+      La dirección de cada rayo es la del jugador girada ese desfase y dividida
+      por su coseno (método del plano de cámara), así que el factor de
+      corrección de ojo de pez ya va incluido: el DDA devuelve directamente la
+      distancia perpendicular. Por fotograma solo queda una rotación.
+    - row_min_height: un muro de altura h ocupa las filas
+      [(HEIGHT - h) // 2, (HEIGHT - h) // 2 + h). Esos tramos están anidados,
+      así que cada fila queda cubierta a partir de una altura mínima; con esta
+      tabla la máscara de muros es una sola comparación.
+    """
+
+    def __init__(self):
+        self.key = None
+
+    def sync(self):
+        """Reconstruye las tablas si ha cambiado el FOV, NUM_RAYS o la ventana."""
+        key = (FOV, NUM_RAYS, WIDTH, HEIGHT)
+        if key == self.key:
+            return
+        self.key = key
+        offsets = -HALF_FOV + np.arange(NUM_RAYS) * DELTA_ANGLE
+        self.plane = np.tan(offsets)
+        self.dir_x = np.empty(NUM_RAYS)
+        self.dir_y = np.empty(NUM_RAYS)
+
+        self.row_min_height = np.full(HEIGHT, HEIGHT + 2)
+        for h in range(HEIGHT + 2, -1, -1):
+            top = (HEIGHT - h) // 2
+            self.row_min_height[max(0, top):max(0, top + h)] = h
+
+        # Suelo y techo: la fila half + k y su simétrica HEIGHT - 1 - half - k
+        # ven el suelo y el techo a HEIGHT / (2p), con p la distancia del
+        # centro de la fila al horizonte (así casan con la base de los muros)
+        half = HEIGHT // 2
+        p = np.maximum(np.arange(half, HEIGHT) + 0.5 - HEIGHT / 2, 0.5)
+        self.row_distance = HEIGHT / (2 * p)
+        shade = SHADE_LUT[np.minimum((self.row_distance * SHADE_STEPS_PER_UNIT + 0.5).astype(np.intp),
+                                     SHADE_LUT.size - 1)]
+        self.row_shade_level = (shade * (FLOOR_SHADE_LEVELS - 1) // 255).astype(np.intp)
+        self.fog_rows = np.zeros(HEIGHT, dtype=np.uint32)
+        self.fog_rows[half:] = _pack_rgb(np.outer(shade / 255, FLOOR_COLOR))
+        self.fog_rows[HEIGHT - 1 - half::-1] = _pack_rgb(np.outer(shade / 255, CEILING_COLOR))
+
+    def ray_directions(self, angle):
+        """Direcciones (ya corregidas) de todos los rayos para un jugador orientado a 'angle'."""
+        self.sync()
+        cos_a = math.cos(angle)
+        sin_a = math.sin(angle)
+        np.multiply(self.plane, -sin_a, out=self.dir_x)
+        self.dir_x += cos_a
+        np.multiply(self.plane, cos_a, out=self.dir_y)
+        self.dir_y += sin_a
+        return self.dir_x, self.dir_y
+
+camera = Camera()
 
 # Variable para controlar la visualización del minimapa.
 show_map = False
 
-def draw_minimap(screen, scale=6):
+# El minimapa muestra como mucho esta ventana de celdas alrededor del jugador,
+# de modo que su coste no depende del tamaño del laberinto.
+MINIMAP_VIEW_CELLS = (91, 81)
+MINIMAP_SHOW_ENTITIES = False  # Marca también enemigos y proyectiles
+
+class MinimapCache:
+    """
+    Superficie del minimapa prerenderizada. El laberinto es estático, así que
+    la ventana visible se dibuja una sola vez y se reutiliza hasta que cambia
+    el mapa, la escala o el origen de la ventana. El origen avanza a saltos de
+    un cuarto de ventana para no redibujar cada vez que el jugador cambia de celda.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.surface = None
+
+    def origin(self):
+        """Celda del mapa que queda en la esquina superior izquierda del minimapa."""
+        view_w = min(MAP_WIDTH, MINIMAP_VIEW_CELLS[0])
+        view_h = min(MAP_HEIGHT, MINIMAP_VIEW_CELLS[1])
+        step_x = max(1, view_w // 4)
+        step_y = max(1, view_h // 4)
+        ox = min(max(0, int(player_x) - view_w // 2) // step_x * step_x, MAP_WIDTH - view_w)
+        oy = min(max(0, int(player_y) - view_h // 2) // step_y * step_y, MAP_HEIGHT - view_h)
+        return ox, oy
+
+    def get(self, scale):
+        """Devuelve (superficie, origen), redibujando solo si la caché no es válida."""
+        ox, oy = self.origin()
+        key = (MAP_VERSION, ox, oy, scale)
+        if key != self.key:
+            view_w = min(MAP_WIDTH, MINIMAP_VIEW_CELLS[0])
+            view_h = min(MAP_HEIGHT, MINIMAP_VIEW_CELLS[1])
+            walls = map_region(ox, oy, ox + view_w, oy + view_h).T == WALL_CELL
+            pixels = np.where(walls[:, :, None], np.array(GRAY, dtype=np.uint8), np.array(WHITE, dtype=np.uint8))
+            cells = pygame.surfarray.make_surface(pixels)
+            self.surface = pygame.transform.scale(cells, (view_w * scale, view_h * scale))
+            self.key = key
+        return self.surface, (ox, oy)
+
+minimap = MinimapCache()
+
+def draw_minimap(screen, scale=6, show_entities=None):
     """
     Dibuja un minimapa en la esquina superior izquierda mostrando el laberinto,
     la posición del jugador y otros objetos a escala.
+    El laberinto sale de la caché; por fotograma solo se dibujan los marcadores.
     """
     if not show_map:
         return
+    if show_entities is None:
+        show_entities = MINIMAP_SHOW_ENTITIES
+
+    surface, (ox, oy) = minimap.get(scale)
+    screen.blit(surface, (0, 0))
+
+    if show_entities:
+        width, height = surface.get_size()
+        for pool, color in ((world.enemies, RED), (world.enemy_projectiles, (128, 0, 128)), (world.player_shots, YELLOW)):
+            for x, y in pool.positions():
+                px = int((x - ox) * scale)
+                py = int((y - oy) * scale)
+                if 0 <= px < width and 0 <= py < height:
+                    screen.fill(color, (px - 1, py - 1, 3, 3))
     
-    for y, row in enumerate(game_map):
-        for x, cell in enumerate(row):
-            color = GRAY if cell == '1' else WHITE
-            rect = pygame.Rect(x * scale, y * scale, scale, scale)
-            pygame.draw.rect(screen, color, rect)
-    
-    player_pos = (int(player_x * scale), int(player_y * scale))
+    player_pos = (int((player_x - ox) * scale), int((player_y - oy) * scale))
     pygame.draw.circle(screen, RED, player_pos, 3)
 
+# =====================================================
+# A3. CONJUNTO POTENCIALMENTE VISIBLE (PVS)
+# =====================================================
+# En un laberinto perfecto la visibilidad entre celdas es estática y muy
+# limitada: desde cada celda abierta se ven unas pocas decenas de celdas. El
+# PVS guarda, para cada celda abierta, las celdas que pueden verse desde algún
+# punto de ella. Lo consultan el descarte de sprites, la línea de visión de los
+# enemigos y el DDA de los rayos. Se calcula al cargar el mapa (en un hilo, sin
+# bloquear el menú) y puede guardarse en disco para no repetir el cálculo.
+
+PVS_SAMPLES = 3           # Puntos de muestreo por lado de cada celda (3 x 3)
+PVS_ANGLES = 360          # Direcciones de los rayos de muestreo
+PVS_MAX_PER_CELL = 64     # Con más celdas visibles de media (salas abiertas) no se construye
+PVS_ESTIMATE_CELLS = 64   # Celdas que se muestrean para estimar ese tamaño antes de construirlo
+PVS_MAX_OPEN_CELLS = 5000 # Con más celdas abiertas no se construye (unos 2 s con 91 x 81, que tiene 3599)
+PVS_BATCH_CELLS = 1024    # Celdas de origen que se procesan a la vez (acota la memoria)
+PVS_CACHE_DIR = None      # Carpeta opcional donde se guardan los PVS ya calculados
+USE_PVS = True            # Con False no se calcula (ni se consulta) el PVS
+
+class PotentiallyVisibleSet:
+    """
+    PVS de un mapa en formato CSR: para la celda abierta i (en el orden de
+    np.flatnonzero), indices[indptr[i]:indptr[i + 1]] son las celdas visibles
+    (índices planos y * ancho + x) y reach[i] es la mayor distancia Manhattan
+    hasta ellas más uno, que acota el número de pasos del DDA.
+    visible_cells devuelve una máscara booleana del mapa que se conserva
+    mientras el observador no cambie de celda: al cambiar solo se borran las
+    celdas de la anterior y se marcan las de la nueva.
+    """
+
+    def __init__(self, maze, indptr, indices, reach):
+        self.height, self.width = maze.shape
+        self.indptr = indptr
+        self.indices = indices
+        self.reach = reach
+        # Celda plana -> fila del CSR (-1 en los muros)
+        self.rows = np.full(maze.size, -1, dtype=np.int32)
+        self.rows[np.flatnonzero(maze.reshape(-1) == OPEN_CELL)] = np.arange(indptr.size - 1, dtype=np.int32)
+        self.mask = np.zeros(maze.size, dtype=bool)
+        self._cell = -1
+        self._shown = indices[:0]
+
+    def row(self, x, y):
+        """Fila del CSR de la celda que contiene (x, y), o -1 si es un muro o está fuera del mapa."""
+        xi = int(x)
+        yi = int(y)
+        if 0 <= xi < self.width and 0 <= yi < self.height:
+            return int(self.rows[yi * self.width + xi])
+        return -1
+
+    def visible_cells(self, x, y):
+        """Máscara plana de las celdas visibles desde (x, y); None si (x, y) no es una celda abierta."""
+        row = self.row(x, y)
+        if row < 0:
+            return None
+        if row != self._cell:
+            self.mask[self._shown] = False
+            self._shown = self.indices[self.indptr[row]:self.indptr[row + 1]]
+            self.mask[self._shown] = True
+            self._cell = row
+        return self.mask
+
+    def max_steps(self, x, y):
+        """Pasos de DDA que bastan para que un rayo lanzado desde (x, y) llegue a un muro (None si no se sabe)."""
+        row = self.row(x, y)
+        return int(self.reach[row]) if row >= 0 else None
+
+def _pvs_pairs(flat, width, sources, samples, angles, limit):
+    """
+    Pares visibles (fuente * tamaño + celda) desde las celdas planas 'sources'
+    de 'flat' (que debe estar rodeado de muros). Lanza rayos desde samples x
+    samples puntos de cada fuente en 'angles' direcciones del semicírculo
+    [0, pi); todas las fuentes y puntos avanzan juntos, una dirección por
+    iteración. Devuelve None en cuanto hay más de 'limit' pares distintos.
+    """
+    size = flat.size
+    offsets = np.linspace(0.01, 0.99, samples)
+    ox, oy = (a.ravel() for a in np.meshgrid(offsets, offsets))
+    src = np.repeat(sources, ox.size)
+    cell_x = src % width
+    cell_y = src // width
+    px = cell_x + np.tile(ox, sources.size)
+    py = cell_y + np.tile(oy, sources.size)
+
+    pending = [sources * size + sources]
+    pending_size = sources.size
+    for k in range(angles):
+        angle = math.pi * k / angles
+        dir_x = math.cos(angle)
+        dir_y = math.sin(angle)
+        delta_x = abs(1 / dir_x) if abs(dir_x) > 1e-12 else 1e30
+        delta_y = abs(1 / dir_y) if abs(dir_y) > 1e-12 else 1e30
+        step_x = -1 if dir_x < 0 else 1
+        side_x = ((px - cell_x) if dir_x < 0 else (cell_x + 1 - px)) * delta_x
+        side_y = (cell_y + 1 - py) * delta_y  # dir_y >= 0 en el semicírculo
+        cell = src.copy()
+        owner = src
+        while owner.size:
+            along_x = side_x < side_y
+            side_x[along_x] += delta_x
+            side_y[~along_x] += delta_y
+            cell += np.where(along_x, step_x, width)
+            still_open = flat[cell] == OPEN_CELL
+            owner = owner[still_open]
+            cell = cell[still_open]
+            side_x = side_x[still_open]
+            side_y = side_y[still_open]
+            pending.append(owner * size + cell)
+            pending_size += owner.size
+            # Se compacta de vez en cuando para que la memoria no crezca con los duplicados
+            if pending_size > 4 * limit:
+                pending = [np.unique(np.concatenate(pending))]
+                pending_size = pending[0].size
+                if pending_size > limit:
+                    return None
+    pairs = np.unique(np.concatenate(pending))
+    return pairs if pairs.size <= limit else None
+
+def build_pvs(maze, samples=PVS_SAMPLES, angles=PVS_ANGLES, max_per_cell=PVS_MAX_PER_CELL,
+              max_open_cells=PVS_MAX_OPEN_CELLS):
+    """
+    Calcula el PVS de 'maze'. Basta con lanzar la mitad de las direcciones
+    porque la visibilidad es simétrica (se añade (b, a) por cada par (a, b)).
+    Después se añade el anillo de 8 vecinas abiertas de cada celda visible, que
+    cubre las rendijas entre los rayos de muestreo y los sprites que asoman
+    desde una celda contigua. Devuelve None si el mapa es demasiado abierto
+    para que el PVS descarte algo (más de max_per_cell celdas visibles de
+    media, estimadas antes con una muestra de celdas) o si tiene más de
+    max_open_cells celdas abiertas: el coste crece más deprisa que el mapa
+    (en 251 x 251 ya eran 13 s). Las celdas de origen se procesan por
+    lotes de PVS_BATCH_CELLS, así que la memoria del cálculo no depende
+    del tamaño del mapa.
+    """
+    height, width = maze.shape
+    # Se trabaja sobre una copia con un borde de muros para que ningún rayo salga del array
+    padded_width = width + 2
+    padded = np.full((height + 2, padded_width), WALL_CELL, dtype=np.uint8)
+    padded[1:-1, 1:-1] = maze
+    flat = padded.reshape(-1)
+    size = flat.size
+    open_cells = np.flatnonzero(flat == OPEN_CELL)
+    n = open_cells.size
+    if n == 0 or n > max_open_cells:
+        return None
+
+    sample = open_cells[np.linspace(0, n - 1, min(n, PVS_ESTIMATE_CELLS)).astype(np.intp)]
+    if _pvs_pairs(flat, padded_width, sample, samples, angles // 2, max_per_cell * sample.size) is None:
+        return None
+    batches = []
+    for first in range(0, n, PVS_BATCH_CELLS):
+        batch = open_cells[first:first + PVS_BATCH_CELLS]
+        pairs = _pvs_pairs(flat, padded_width, batch, samples, angles // 2, max_per_cell * batch.size)
+        if pairs is None:
+            return None
+        batches.append(pairs)
+    pairs = np.concatenate(batches)
+
+    a, b = np.divmod(pairs, size)
+    pairs = np.unique(np.concatenate((pairs, b * size + a)))
+    a, b = np.divmod(pairs, size)
+    ring = [pairs]
+    for d in (1, -1, padded_width, -padded_width,
+              padded_width + 1, padded_width - 1, -padded_width + 1, -padded_width - 1):
+        near = b + d
+        still_open = flat[near] == OPEN_CELL  # El borde de muros evita salirse del array
+        ring.append(a[still_open] * size + near[still_open])
+    a, b = np.divmod(np.unique(np.concatenate(ring)), size)
+
+    # Del mapa con borde a índices planos de 'maze'; 'a' queda ordenado por celda de origen
+    sources = np.searchsorted(open_cells, a)
+    ay, ax = np.divmod(a, padded_width)
+    by, bx = np.divmod(b, padded_width)
+    indices = ((by - 1) * width + (bx - 1)).astype(np.int32)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+    reach = np.zeros(n, dtype=np.int32)
+    np.maximum.at(reach, sources, (np.abs(bx - ax) + np.abs(by - ay)).astype(np.int32))
+    return PotentiallyVisibleSet(maze, indptr, indices, reach + 1)
+
+def _pvs_cache_path(maze):
+    # La clave es el contenido del mapa (y los parámetros del muestreo), no la
+    # semilla: identifica igual los laberintos con semilla y vale también para
+    # los que no la tienen o no salen de generate_maze.
+    digest = hashlib.sha1(np.ascontiguousarray(maze).tobytes())
+    digest.update(repr((maze.shape, PVS_SAMPLES, PVS_ANGLES, PVS_MAX_PER_CELL)).encode())
+    return os.path.join(PVS_CACHE_DIR, f"pvs_{maze.shape[1]}x{maze.shape[0]}_{digest.hexdigest()[:16]}.npz")
+
+def load_or_build_pvs(maze):
+    """
+    Devuelve el PVS de 'maze', leyéndolo de PVS_CACHE_DIR si está definida y
+    ya se calculó antes, o construyéndolo (y guardándolo) si no. Los mapas en
+    los que no se construye se guardan también, sin arrays, para no volver a
+    intentarlo.
+    """
+    if PVS_CACHE_DIR is None:
+        return build_pvs(maze)
+    path = _pvs_cache_path(maze)
+    try:
+        with np.load(path) as data:
+            if "indptr" not in data:
+                return None
+            return PotentiallyVisibleSet(maze, data["indptr"], data["indices"], data["reach"])
+    except (OSError, ValueError, KeyError):
+        pass
+    result = build_pvs(maze)
+    os.makedirs(PVS_CACHE_DIR, exist_ok=True)
+    if result is None:
+        np.savez(path, none=np.zeros(0))
+    else:
+        np.savez(path, indptr=result.indptr, indices=result.indices, reach=result.reach)
+    return result
+
+# Hilo del último cálculo lanzado (el PVS de cada mapa se guarda en su GameMap)
+_pvs_thread = None
+
+def _pvs_worker(level):
+    start = time.perf_counter()
+    level.pvs = load_or_build_pvs(level.cells)
+    STARTUP_TIMES["pvs"] = time.perf_counter() - start
+
+def start_pvs_build(level=None, wait=False):
+    """
+    Calcula el PVS de 'level' (por defecto, el mapa instalado) en un hilo
+    aparte, para que avance mientras el menú espera al jugador. Hasta que
+    termina, level.pvs es None y las consultas no descartan nada. Con
+    wait=True espera a que acabe bloqueando el hilo que llama; main no lo
+    usa, sino que mantiene el fundido en negro mientras pvs_building().
+    """
+    global _pvs_thread
+    level = current_map if level is None else level
+    if not USE_PVS or level is None or level.cells is None:
+        return
+    if not level.pvs_requested:
+        if wait and _pvs_thread is not None:
+            _pvs_thread.join()  # Cálculo de otro mapa que aún no ha terminado
+        if _pvs_thread is None or not _pvs_thread.is_alive():
+            _pvs_thread = threading.Thread(target=_pvs_worker, args=(level,), name="pvs", daemon=True)
+            level.pvs_requested = True
+            _pvs_thread.start()
+    if wait and _pvs_thread is not None:
+        _pvs_thread.join()
+
+def pvs_building():
+    """
+    Indica si hay un cálculo de PVS en marcha. La partida no debe empezar
+    mientras tanto, porque el hilo compite por el GIL con el bucle principal
+    y dispara los tiempos de fotograma.
+    """
+    return _pvs_thread is not None and _pvs_thread.is_alive()
+
+def current_pvs():
+    """El PVS del mapa instalado, o None si aún no está listo."""
+    return current_map.pvs if current_map is not None else None
+
+def potentially_visible(level, x, y, xs, ys):
+    """
+    Indica qué puntos (xs, ys) de 'level' pueden ser visibles desde (x, y)
+    según su PVS. Devuelve None si no hay PVS o (x, y) no está en una celda
+    abierta; los puntos fuera del mapa se cuentan como visibles.
+    """
+    current = level.pvs
+    mask = current.visible_cells(x, y) if current is not None else None
+    if mask is None:
+        return None
+    xi = np.asarray(xs).astype(np.intp)
+    yi = np.asarray(ys).astype(np.intp)
+    inside = (xi >= 0) & (xi < level.width) & (yi >= 0) & (yi < level.height)
+    result = ~inside
+    result[inside] = mask[yi[inside] * level.width + xi[inside]]
+    return result
+
+# =====================================================
+# B1. ALMACÉN DE ENTIDADES (STRUCT-OF-ARRAYS)
+# =====================================================
+
+class EntityPool:
+    """
+    Almacena entidades (enemigos, disparos, proyectiles) como arrays paralelos
+    de NumPy en lugar de una lista de diccionarios: la entidad i ocupa la
+    posición i de x, y, angle, vx, vy y timer. Solo las primeras 'count'
+    posiciones están vivas; la capacidad se duplica cuando hace falta.
+    Al borrar, las entidades que quedan conservan su orden.
+    'version' cambia cada vez que se añade, borra o mueve alguna entidad.
+    px, py guardan la posición anterior al último move(): el tramo recorrido
+    en el último paso, para las colisiones continuas y la interpolación.
+    """
+    FIELDS = ("x", "y", "px", "py", "angle", "vx", "vy", "timer")
+
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.version = 0
+        for name in self.FIELDS:
+            setattr(self, name, np.zeros(capacity))
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self):
+        for name in self.FIELDS:
+            old = getattr(self, name)
+            new = np.zeros(old.size * 2)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def add(self, x, y, angle=0.0, speed=0.0, timer=0.0):
+        """Añade una entidad; la velocidad se descompone una sola vez en vx, vy."""
+        if self.count == self.x.size:
+            self._grow()
+        i = self.count
+        self.x[i] = self.px[i] = x
+        self.y[i] = self.py[i] = y
+        self.angle[i] = angle
+        self.vx[i] = math.cos(angle) * speed
+        self.vy[i] = math.sin(angle) * speed
+        self.timer[i] = timer
+        self.count += 1
+        self.version += 1
+        return i
+
+    def remove_mask(self, mask):
+        """Borra de una vez todas las entidades vivas marcadas en 'mask'."""
+        if not mask.any():
+            return
+        keep = ~mask
+        n = int(np.count_nonzero(keep))
+        for name in self.FIELDS:
+            arr = getattr(self, name)
+            arr[:n] = arr[:self.count][keep]
+        self.count = n
+        self.version += 1
+
+    def clear(self):
+        self.count = 0
+        self.version += 1
+
+    def segments(self):
+        """Arrays (x0, y0, x1, y1) con el tramo recorrido por cada entidad viva en el último paso."""
+        n = self.count
+        return self.px[:n], self.py[:n], self.x[:n], self.y[:n]
+
+    def interpolated(self, alpha):
+        """Posiciones (x, y) a una fracción 'alpha' del último paso, para dibujar entre pasos."""
+        n = self.count
+        return (self.px[:n] + (self.x[:n] - self.px[:n]) * alpha,
+                self.py[:n] + (self.y[:n] - self.py[:n]) * alpha)
+
+    def positions(self):
+        """Itera sobre (x, y) de las entidades vivas como floats de Python."""
+        return zip(self.x[:self.count].tolist(), self.y[:self.count].tolist())
+
+    def move(self):
+        """Avanza todas las entidades vivas un paso según su velocidad."""
+        n = self.count
+        self.px[:n] = self.x[:n]
+        self.py[:n] = self.y[:n]
+        self.x[:n] += self.vx[:n]
+        self.y[:n] += self.vy[:n]
+        self.version += 1
+
+def segment_wall_hits(level, x0, y0, x1, y1):
+    """
+    Colisión continua contra el mapa 'level': para cada segmento (x0, y0) -> (x1, y1)
+    devuelve la fracción t en [0, 1] del recorrido en la que entra en la
+    primera celda de muro (0 si ya empieza dentro de un muro) o infinito si
+    no toca ninguno. Recorre a la vez, celda a celda, todas las celdas que
+    cruza cada segmento (Amanatides-Woo), como lines_of_sight; salir del mapa
+    cuenta como muro y en un cruce exacto por una esquina basta con que una de
+    las dos celdas sea muro.
+    """
+    x0 = np.asarray(x0, dtype=float)
+    y0 = np.asarray(y0, dtype=float)
+    dx = np.asarray(x1, dtype=float) - x0
+    dy = np.asarray(y1, dtype=float) - y0
+    cx = np.floor(x0).astype(np.intp)
+    cy = np.floor(y0).astype(np.intp)
+    remaining = np.abs(np.floor(x1).astype(np.intp) - cx) + np.abs(np.floor(y1).astype(np.intp) - cy)
+
+    step_x = np.where(dx > 0, 1, -1)
+    step_y = np.where(dy > 0, 1, -1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_delta_x = np.where(dx != 0, np.abs(1 / dx), np.inf)
+        t_delta_y = np.where(dy != 0, np.abs(1 / dy), np.inf)
+        t_max_x = np.where(dx != 0, np.where(dx > 0, cx + 1 - x0, x0 - cx) * t_delta_x, np.inf)
+        t_max_y = np.where(dy != 0, np.where(dy > 0, cy + 1 - y0, y0 - cy) * t_delta_y, np.inf)
+
+    t_hit = np.full(x0.size, np.inf)
+    t_hit[level.walls_at(cx, cy)] = 0.0
+    active = np.flatnonzero((remaining > 0) & np.isinf(t_hit))
+    while active.size:
+        tmx = t_max_x[active]
+        tmy = t_max_y[active]
+        t_enter = np.minimum(tmx, tmy)
+        along_x = tmx <= tmy
+        along_y = tmy <= tmx
+
+        blocked = np.zeros(active.size, dtype=bool)
+        corner = along_x & along_y
+        if corner.any():
+            c = active[corner]
+            blocked[corner] = level.walls_at(cx[c] + step_x[c], cy[c]) | level.walls_at(cx[c], cy[c] + step_y[c])
+
+        ax = active[along_x]
+        cx[ax] += step_x[ax]
+        t_max_x[ax] += t_delta_x[ax]
+        remaining[ax] -= 1
+        ay = active[along_y]
+        cy[ay] += step_y[ay]
+        t_max_y[ay] += t_delta_y[ay]
+        remaining[ay] -= 1
+
+        blocked |= level.walls_at(cx[active], cy[active])
+        t_hit[active[blocked]] = t_enter[blocked]
+        active = active[~blocked & (remaining[active] > 0)]
+    return t_hit
+
+def segment_box_entry(x0, y0, x1, y1, bx, by, half_size):
+    """
+    Colisión continua segmento contra caja (método de las franjas): fracción
+    t en [0, 1] en la que cada segmento entra en el cuadrado de lado
+    2 * half_size centrado en (bx, by), o infinito si no lo toca. Los bordes
+    de la caja cuentan como dentro, igual que en box_hits.
+    """
+    dx = x1 - x0
+    dy = y1 - y0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tx0 = (bx - half_size - x0) / dx
+        tx1 = (bx + half_size - x0) / dx
+        ty0 = (by - half_size - y0) / dy
+        ty1 = (by + half_size - y0) / dy
+    # Un segmento paralelo a un eje solo entra si ya está dentro de esa franja
+    inside_x = np.abs(x0 - bx) <= half_size
+    inside_y = np.abs(y0 - by) <= half_size
+    t_min_x = np.where(dx != 0, np.minimum(tx0, tx1), np.where(inside_x, -np.inf, np.inf))
+    t_max_x = np.where(dx != 0, np.maximum(tx0, tx1), np.where(inside_x, np.inf, -np.inf))
+    t_min_y = np.where(dy != 0, np.minimum(ty0, ty1), np.where(inside_y, -np.inf, np.inf))
+    t_max_y = np.where(dy != 0, np.maximum(ty0, ty1), np.where(inside_y, np.inf, -np.inf))
+    t_enter = np.maximum(np.maximum(t_min_x, t_min_y), 0.0)
+    t_exit = np.minimum(np.minimum(t_max_x, t_max_y), 1.0)
+    return np.where(t_enter <= t_exit, t_enter, np.inf)
+
+def segment_circle_entry(x0, y0, x1, y1, cx, cy, radius):
+    """
+    Colisión continua segmento contra círculo: fracción t en [0, 1] en la que
+    cada segmento se acerca a menos de 'radius' del punto (cx, cy), o
+    infinito si no llega a hacerlo.
+    """
+    dx = x1 - x0
+    dy = y1 - y0
+    fx = x0 - cx
+    fy = y0 - cy
+    a = dx * dx + dy * dy
+    b = fx * dx + fy * dy
+    c = fx * fx + fy * fy - radius * radius
+    disc = b * b - a * c
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_enter = np.where(a > 0, (-b - np.sqrt(np.maximum(disc, 0.0))) / a, np.inf)
+    t_enter = np.where(c < 0, 0.0, t_enter)  # Empieza ya dentro del círculo
+    return np.where((disc > 0) & (t_enter >= 0) & (t_enter <= 1), t_enter, np.inf)
+
+def box_hits(points, boxes, half_size):
+    """
+    Matriz booleana (puntos x cajas): True donde la entidad i de 'points' está
+    dentro del cuadrado de lado 2 * half_size centrado en la entidad j de 'boxes'.
+    Compara todos contra todos; se conserva como referencia para benchmark_collisions.
+    """
+    px = points.x[:points.count, None]
+    py = points.y[:points.count, None]
+    bx = boxes.x[:boxes.count]
+    by = boxes.y[:boxes.count]
+    return (bx - half_size <= px) & (px <= bx + half_size) & (by - half_size <= py) & (py <= by + half_size)
+
+# =====================================================
+# B2. ÍNDICE ESPACIAL POR CELDAS
+# =====================================================
+
+class SpatialHash:
+    """
+    Índice espacial uniforme sobre las celdas del mapa para las colisiones
+    entre entidades. Las entidades de un EntityPool se ordenan por la celda que
+    contiene su centro, de modo que las de una celda forman un tramo contiguo
+    que se localiza con una búsqueda binaria. Solo se reconstruye cuando cambia
+    la versión del almacén indexado.
+    """
+
+    def __init__(self, width, height):
+        self.width = width    # Dimensiones del mapa indexado
+        self.height = height
+        self.pool = None
+        self.version = -1
+        self.order = np.zeros(0, dtype=np.intp)   # índices de entidad ordenados por celda
+        self.cells = np.zeros(0, dtype=np.intp)   # celda de cada entrada de 'order'
+
+    def rebuild(self, pool):
+        """Indexa las entidades vivas de 'pool' si han cambiado desde la última vez."""
+        if pool is self.pool and pool.version == self.version:
+            return
+        n = pool.count
+        cx = np.clip(np.floor(pool.x[:n]).astype(np.intp), 0, self.width - 1)
+        cy = np.clip(np.floor(pool.y[:n]).astype(np.intp), 0, self.height - 1)
+        cells = cy * self.width + cx
+        self.order = np.argsort(cells, kind="stable")
+        self.cells = cells[self.order]
+        self.pool = pool
+        self.version = pool.version
+
+    def pairs(self, xs, ys, reach):
+        """
+        Pares candidatos (punto, entidad) para los puntos (xs, ys): entidades
+        cuyo centro está en alguna celda a menos de 'reach' de la del punto.
+        Dentro de una fila del mapa las celdas vecinas tienen claves seguidas,
+        así que cada fila del vecindario es un único tramo de 'cells' y basta
+        con dos búsquedas binarias por fila y punto, todas a la vez.
+        """
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        k = max(1, int(math.ceil(reach)))
+        cx = np.floor(xs).astype(np.intp)[:, None]
+        cy = np.floor(ys).astype(np.intp)[:, None]
+        ny = cy + np.arange(-k, k + 1)                       # (puntos, filas)
+        x_lo = np.maximum(cx - k, 0)
+        x_hi = np.minimum(cx + k, self.width - 1)
+        valid = (ny >= 0) & (ny < self.height) & (x_lo <= x_hi)
+        lo = np.searchsorted(self.cells, (ny * self.width + x_lo).ravel(), side="left")
+        hi = np.searchsorted(self.cells, (ny * self.width + x_hi).ravel(), side="right")
+        counts = np.where(valid.ravel(), hi - lo, 0)
+        total = int(counts.sum())
+        # Expande cada tramo [lo, hi) en una entrada por entidad
+        starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+        point_ids = np.repeat(np.arange(xs.size), 2 * k + 1)
+        return np.repeat(point_ids, counts), self.order[starts + np.arange(total)]
+
+    def box_query(self, xs, ys, half_size):
+        """
+        Pares (punto, entidad) en los que el punto está dentro del cuadrado de
+        lado 2 * half_size centrado en la entidad, ordenados por punto y
+        después por índice de entidad.
+        """
+        points, entities = self.pairs(xs, ys, half_size)
+        px = np.asarray(xs)[points]
+        py = np.asarray(ys)[points]
+        bx = self.pool.x[entities]
+        by = self.pool.y[entities]
+        inside = (bx - half_size <= px) & (px <= bx + half_size) & (by - half_size <= py) & (py <= by + half_size)
+        points = points[inside]
+        entities = entities[inside]
+        order = np.lexsort((entities, points))
+        return points[order], entities[order]
+
+    def segment_box_query(self, x0, y0, x1, y1, half_size):
+        """
+        Pares (segmento, entidad, t) en los que el segmento (x0, y0) -> (x1, y1)
+        atraviesa el cuadrado de lado 2 * half_size centrado en la entidad; t
+        es la fracción del segmento en la que entra. Ordenados por segmento,
+        después por t y después por índice de entidad.
+        """
+        x0 = np.asarray(x0, dtype=float)
+        y0 = np.asarray(y0, dtype=float)
+        x1 = np.asarray(x1, dtype=float)
+        y1 = np.asarray(y1, dtype=float)
+        if x0.size == 0:
+            empty = np.zeros(0, dtype=np.intp)
+            return empty, empty, np.zeros(0)
+        # Cualquier caja que toque el segmento tiene su centro a menos de esta distancia del final
+        reach = float(np.max(np.hypot(x1 - x0, y1 - y0))) + half_size * math.sqrt(2)
+        segments, entities = self.pairs(x1, y1, reach)
+        t = segment_box_entry(x0[segments], y0[segments], x1[segments], y1[segments],
+                              self.pool.x[entities], self.pool.y[entities], half_size)
+        hit = np.isfinite(t)
+        segments, entities, t = segments[hit], entities[hit], t[hit]
+        order = np.lexsort((entities, t, segments))
+        return segments[order], entities[order], t[order]
+
+    def radius_query(self, x, y, radius):
+        """Índices de las entidades a menos de 'radius' del punto (x, y)."""
+        _, entities = self.pairs([x], [y], radius)
+        close = np.hypot(self.pool.x[entities] - x, self.pool.y[entities] - y) < radius
+        return entities[close]
+
+def benchmark_collisions(enemy_counts=(10, 100, 1000, 5000, 20000), num_shots=200, repeats=20):
+    """
+    Compara el coste por disparo de la colisión disparo-enemigo por fuerza
+    bruta (box_hits) y con SpatialHash a medida que crece el número de enemigos.
+    La reconstrucción del índice se mide aparte: en el juego solo ocurre
+    cuando aparecen o mueren enemigos.
+    """
+    rng = np.random.default_rng(0)
+    open_y, open_x = np.nonzero(ensure_game_map() == OPEN_CELL)
+    shots = EntityPool()
+    for i in rng.integers(0, open_x.size, num_shots):
+        shots.add(open_x[i] + rng.random(), open_y[i] + rng.random())
+    shot_x = shots.x[:num_shots]
+    shot_y = shots.y[:num_shots]
+    index = SpatialHash(MAP_WIDTH, MAP_HEIGHT)
+
+    print(f"{'enemigos':>9} {'fuerza bruta (us/disparo)':>26} {'hash (us/disparo)':>18} {'reconstrucción (ms)':>20}")
+    for count in enemy_counts:
+        pool = EntityPool()
+        for i in rng.integers(0, open_x.size, count):
+            pool.add(open_x[i] + 0.5, open_y[i] + 0.5)
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            box_hits(shots, pool, 0.4).any(axis=1)
+        brute = (time.perf_counter() - start) / (repeats * num_shots) * 1e6
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            pool.version += 1  # Fuerza la reconstrucción
+            index.rebuild(pool)
+        rebuild = (time.perf_counter() - start) / repeats * 1e3
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            index.box_query(shot_x, shot_y, 0.4)
+        hashed = (time.perf_counter() - start) / (repeats * num_shots) * 1e6
+        print(f"{count:>9} {brute:>26.3f} {hashed:>18.3f} {rebuild:>20.3f}")
+
 # =====================================================
 # B. MANEJO DE ENEMIGOS
 # =====================================================
 
-def spawn_enemy():
+def spawn_enemy(state):
     """
     Genera un enemigo de forma aleatoria en el mapa.
     El enemigo se genera en una celda abierta y se posiciona en el centro de ella.
@@ -389,32 +1594,38 @@ def spawn_enemy():
     """
     attempts = 0
     while attempts < 100:
-        rx = random.randint(1, MAP_WIDTH - 2)
-        ry = random.randint(1, MAP_HEIGHT - 2)
-        if game_map[ry][rx] == ' ':
+        rx = state.rng.randint(1, state.map.width - 2)
+        ry = state.rng.randint(1, state.map.height - 2)
+        if not state.map.is_wall(rx, ry):
             ex = rx + 0.5
             ey = ry + 0.5
-            dx = ex - player_x
-            dy = ey - player_y
+            dx = ex - state.player_x
+            dy = ey - state.player_y
             angle_to_candidate = math.atan2(dy, dx)
-            angle_diff = angle_to_candidate - player_angle
+            angle_diff = angle_to_candidate - state.player_angle
             while angle_diff > math.pi:
                 angle_diff -= 2 * math.pi
             while angle_diff < -math.pi:
                 angle_diff += 2 * math.pi
             if abs(angle_diff) < math.pi / 2:  # Debe estar en frente del jugador
-                return {"x": ex, "y": ey, "timer": 0.0}
+                return ex, ey
         attempts += 1
     return None
 
-enemies = []
+def update_enemy_spawns(state, dt, events):
+    """Generación controlada de enemigos: se generan tres enemigos por cada ciclo de spawn."""
+    state.enemy_spawn_timer += dt
+    if state.enemy_spawn_timer >= state.enemy_spawn_interval:
+        for _ in range(3):
+            new_enemy = spawn_enemy(state)
+            if new_enemy:
+                state.enemies.add(*new_enemy)
+                events.append("enemy_spawned")
+        state.enemy_spawn_timer = 0.0
+
+# Valores por defecto de cada partida (GameState los copia al crearse)
 enemy_spawn_interval = 15.0  # Intervalo en segundos para el spawn
-enemy_spawn_timer = 0.0
-
-# Listas para proyectiles
-enemy_projectiles = []  
-player_shots = []  
-
+# Velocidades en celdas por paso de simulación (SIM_DT)
 enemy_projectile_speed = 3.0
 player_shot_speed = 4.0
 
@@ -422,56 +1633,136 @@ player_shot_speed = 4.0
 # C. SÍNTESIS DE SONIDOS MONOFÓNICOS
 # =====================================================
 
-def create_tone(frequency, duration, volume=0.5, sample_rate=44100):
-    """
-    Genera un tono monofónico a la frecuencia y duración especificadas.
-    Devuelve un objeto Sound de pygame.
-    """
+def tone_samples(frequency, duration, volume=0.5, sample_rate=44100):
+    """Muestras PCM de 16 bits (mono) de un tono senoidal."""
     n_samples = int(duration * sample_rate)
     t = np.linspace(0, duration, n_samples, endpoint=False)
     waveform = np.sin(2 * math.pi * frequency * t) * volume
-    waveform = (waveform * 32767).astype(np.int16)
+    return (waveform * 32767).astype(np.int16)
 
+def make_sound(samples):
+    """Crea un Sound de pygame a partir de muestras mono, duplicándolas si el mezclador es estéreo."""
     mixer_info = pygame.mixer.get_init()  # (frecuencia, tamaño, canales)
     if mixer_info is not None and mixer_info[2] == 2:
-        waveform = np.column_stack((waveform, waveform))
-    sound = pygame.sndarray.make_sound(waveform)
-    return sound
+        samples = np.column_stack((samples, samples))
+    return pygame.sndarray.make_sound(samples)
 
-ray_sound = create_tone(600, 0.1, volume=0.5)       # Sonido del disparo del jugador
-enemy_hit_sound = create_tone(800, 0.2, volume=0.5)   # Sonido de impacto en el enemigo
-player_hit_sound = create_tone(400, 0.2, volume=0.5)  # Sonido de impacto en el jugador
-wall_hit_sound = create_tone(1000, 0.05, volume=0.5)  # Sonido al impactar un muro
+def create_tone(frequency, duration, volume=0.5, sample_rate=44100):
+    """
+    Genera un tono monofónico a la frecuencia y duración especificadas.
+    Devuelve un objeto Sound de pygame.
+    """
+    return make_sound(tone_samples(frequency, duration, volume, sample_rate))
+
+SOUND_CACHE_DIR = None  # Carpeta opcional donde se guardan las muestras ya sintetizadas
+
+class SoundBank:
+    """
+    Banco de sonidos procedurales con síntesis perezosa y un límite de voces.
+
+    define() solo registra los parámetros del tono; las muestras se generan
+    la primera vez que el sonido se reproduce y quedan en memoria (y en
+    SOUND_CACHE_DIR, si está definida, como .npy con la frecuencia, la
+    duración, el volumen y la frecuencia de muestreo en el nombre).
+
+    play() no suena enseguida: anota el sonido y flush(), una vez por
+    fotograma, reproduce cada sonido pedido una sola vez aunque se haya
+    pedido muchas. Además no se pasa de 'max_voices' canales sonando a la vez
+    ni de 'max_per_sound' copias del mismo sonido; lo que no cabe se descarta
+    en lugar de robar canales a lo que ya suena.
+    """
+
+    def __init__(self, max_voices=8, max_per_sound=2):
+        self.max_voices = max_voices
+        self.max_per_sound = max_per_sound
+        self.specs = {}
+        self.sounds = {}
+        self.pending = {}  # Nombres pedidos en este fotograma (dict para conservar el orden)
+        self._channels_ready = False
+
+    def define(self, name, frequency, duration, volume=0.5):
+        self.specs[name] = (frequency, duration, volume)
+        self.sounds.pop(name, None)
+
+    def _samples(self, frequency, duration, volume, sample_rate):
+        if SOUND_CACHE_DIR is None:
+            return tone_samples(frequency, duration, volume, sample_rate)
+        path = os.path.join(SOUND_CACHE_DIR, "tone_%g_%g_%g_%d.npy" % (frequency, duration, volume, sample_rate))
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            samples = tone_samples(frequency, duration, volume, sample_rate)
+            os.makedirs(SOUND_CACHE_DIR, exist_ok=True)
+            np.save(path, samples)
+            return samples
+
+    def get(self, name):
+        """Devuelve el Sound 'name', sintetizándolo si aún no existe. Requiere el mezclador iniciado."""
+        sound = self.sounds.get(name)
+        if sound is None:
+            sample_rate = pygame.mixer.get_init()[0]
+            sound = make_sound(self._samples(*self.specs[name], sample_rate))
+            self.sounds[name] = sound
+        return sound
+
+    def play(self, name):
+        self.pending[name] = True
+
+    def flush(self):
+        """Reproduce los sonidos pedidos desde la última llamada respetando el límite de voces."""
+        if not self.pending:
+            return
+        if not init_mixer():
+            self.pending.clear()  # Sin dispositivo de audio
+            return
+        if not self._channels_ready:
+            pygame.mixer.set_num_channels(self.max_voices)
+            self._channels_ready = True
+        for name in self.pending:
+            sound = self.get(name)
+            if sound.get_num_channels() >= self.max_per_sound:
+                continue
+            channel = pygame.mixer.find_channel()
+            if channel is None:
+                break  # Todas las voces ocupadas
+            channel.play(sound)
+        self.pending.clear()
+
+sounds = SoundBank()
+sounds.define("ray", 600, 0.1, volume=0.5)         # Disparo (del jugador o de un enemigo)
+sounds.define("enemy_hit", 800, 0.2, volume=0.5)   # Impacto en el enemigo
+sounds.define("player_hit", 400, 0.2, volume=0.5)  # Impacto en el jugador
+sounds.define("wall_hit", 1000, 0.05, volume=0.5)  # Impacto en un muro
 
 # =====================================================
 # D. FUNCIONES DE MOVIMIENTO Y RAYCASTING
 # =====================================================
 
-def move_player():
-    """Actualiza la posición y el ángulo del jugador según las teclas y las colisiones."""
-    global player_x, player_y, player_angle
-    keys = pygame.key.get_pressed()
-    if keys[pygame.K_LEFT]:
-        player_angle -= 0.03
-    if keys[pygame.K_RIGHT]:
-        player_angle += 0.03
-    if keys[pygame.K_UP]:
-        next_x = player_x + math.cos(player_angle) * player_speed
-        next_y = player_y + math.sin(player_angle) * player_speed
-        if game_map[int(next_y)][int(next_x)] != '1':
-            player_x = next_x
-            player_y = next_y
-    if keys[pygame.K_DOWN]:
-        next_x = player_x - math.cos(player_angle) * player_speed
-        next_y = player_y - math.sin(player_angle) * player_speed
-        if game_map[int(next_y)][int(next_x)] != '1':
-            player_x = next_x
-            player_y = next_y
-
-def draw_walls(screen):
-    """Renderiza las paredes utilizando el algoritmo DDA y actualiza el z-buffer."""
-    global z_buffer
-    z_buffer = [0.0 for _ in range(NUM_RAYS)]
+def move_player(state, inputs):
+    """Actualiza la posición y el ángulo del jugador según la entrada (Inputs) y las colisiones."""
+    if inputs.left:
+        state.player_angle -= state.player_turn_speed
+    if inputs.right:
+        state.player_angle += state.player_turn_speed
+    if inputs.forward:
+        next_x = state.player_x + math.cos(state.player_angle) * state.player_speed
+        next_y = state.player_y + math.sin(state.player_angle) * state.player_speed
+        if not state.map.is_wall(next_x, next_y):
+            state.player_x = next_x
+            state.player_y = next_y
+    if inputs.back:
+        next_x = state.player_x - math.cos(state.player_angle) * state.player_speed
+        next_y = state.player_y - math.sin(state.player_angle) * state.player_speed
+        if not state.map.is_wall(next_x, next_y):
+            state.player_x = next_x
+            state.player_y = next_y
+
+def cast_rays_python():
+    """
+    Proyecta los rayos uno a uno con el bucle DDA original en Python puro.
+    Se conserva como referencia para comparar resultados y rendimiento con
+    el motor vectorizado. Escribe las distancias corregidas en el z-buffer.
+    """
     for ray in range(NUM_RAYS):
         ray_angle = player_angle - HALF_FOV + ray * DELTA_ANGLE
         ray_dir_x = math.cos(ray_angle)
@@ -511,13 +1802,21 @@ def draw_walls(screen):
             if map_x < 0 or map_x >= MAP_WIDTH or map_y < 0 or map_y >= MAP_HEIGHT:
                 hit = True
                 distance = MAX_DEPTH
-            elif game_map[map_y][map_x] == '1':
+            elif is_wall(map_x, map_y):
                 hit = True
 
         if side == 0:
             distance = (map_x - player_x + (1 - step_x) / 2) / ray_dir_x
+            wall_x = player_y + distance * ray_dir_y
+            flip = ray_dir_x > 0
         else:
             distance = (map_y - player_y + (1 - step_y) / 2) / ray_dir_y
+            wall_x = player_x + distance * ray_dir_x
+            flip = ray_dir_y < 0
+        # Se invierte u en dos de las cuatro caras para que la textura no salga en espejo
+        u = wall_x - math.floor(wall_x)
+        wall_u[ray] = 1 - u if flip else u
+        wall_side[ray] = side
 
         distance *= math.cos(player_angle - ray_angle)
         if distance == 0:
@@ -525,244 +1824,1132 @@ def draw_walls(screen):
 
         z_buffer[ray] = distance
 
+def cast_rays_numpy():
+    """
+    Proyecta todos los rayos a la vez con arrays de NumPy.
+    Cada iteración avanza una celda en todos los rayos que siguen activos
+    (los que aún no han chocado con un muro ni salido del mapa), de modo que
+    el número de pasos en Python depende del rayo más largo y no de NUM_RAYS.
+    Las direcciones salen de las tablas de la cámara con la corrección de ojo
+    de pez incluida. El resultado coincide con el de cast_rays_python salvo
+    por redondeo.
+    """
+    ray_dir_x, ray_dir_y = camera.ray_directions(player_angle)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta_dist_x = np.where(ray_dir_x != 0, np.abs(1 / ray_dir_x), 1e30)
+        delta_dist_y = np.where(ray_dir_y != 0, np.abs(1 / ray_dir_y), 1e30)
+
+    start_x = int(player_x)
+    start_y = int(player_y)
+    map_x = np.full(NUM_RAYS, start_x)
+    map_y = np.full(NUM_RAYS, start_y)
+
+    step_x = np.where(ray_dir_x < 0, -1, 1)
+    step_y = np.where(ray_dir_y < 0, -1, 1)
+    side_dist_x = np.where(ray_dir_x < 0, (player_x - start_x) * delta_dist_x,
+                           (start_x + 1.0 - player_x) * delta_dist_x)
+    side_dist_y = np.where(ray_dir_y < 0, (player_y - start_y) * delta_dist_y,
+                           (start_y + 1.0 - player_y) * delta_dist_y)
+    side = np.zeros(NUM_RAYS, dtype=np.int8)
+
+    # Ningún rayo da más pasos que el ancho más el alto del mapa; con PVS, el
+    # límite es su alcance desde la celda del jugador. Si todas las celdas a esa
+    # distancia (Manhattan) caen dentro del mapa, se consultan directamente en
+    # el array plano, sin las comprobaciones de límites de walls_at.
+    current = current_pvs()
+    max_steps = current.max_steps(player_x, player_y) if current is not None else None
+    if max_steps is None:
+        max_steps = MAP_WIDTH + MAP_HEIGHT + 2
+    unchecked = (game_map is not None and
+                 max_steps <= min(start_x, start_y, MAP_WIDTH - 1 - start_x, MAP_HEIGHT - 1 - start_y))
+    cells = game_map.reshape(-1) if unchecked else None
+
+    # Índices de los rayos que todavía no han impactado
+    active = RAY_IDS.astype(np.intp)
+    steps = 0
+    while active.size and steps < max_steps:
+        along_x = side_dist_x[active] < side_dist_y[active]
+        ax = active[along_x]
+        ay = active[~along_x]
+
+        side_dist_x[ax] += delta_dist_x[ax]
+        map_x[ax] += step_x[ax]
+        side[ax] = 0  # Impacto en un borde vertical
+
+        side_dist_y[ay] += delta_dist_y[ay]
+        map_y[ay] += step_y[ay]
+        side[ay] = 1  # Impacto en un borde horizontal
+
+        if unchecked:
+            hit = cells[map_y[active] * MAP_WIDTH + map_x[active]] == WALL_CELL
+        else:
+            # Fuera del mapa también cuenta como impacto
+            hit = walls_at(map_x[active], map_y[active])
+        active = active[~hit]
+        steps += 1
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distance = np.where(side == 0,
+                            (map_x - player_x + (1 - step_x) / 2) / ray_dir_x,
+                            (map_y - player_y + (1 - step_y) / 2) / ray_dir_y)
+
+    distance[distance == 0] = 0.0001
+
+    z_buffer[:] = distance
+    # Como las direcciones ya vienen divididas por el coseno, la distancia
+    # perpendicular lleva directamente al punto de impacto
+    wall_x = np.where(side == 0, player_y + distance * ray_dir_y, player_x + distance * ray_dir_x)
+    u = wall_x - np.floor(wall_x)
+    flip = np.where(side == 0, ray_dir_x > 0, ray_dir_y < 0)
+    wall_u[:] = np.where(flip, 1 - u, u)
+    wall_side[:] = side
+
+def draw_wall_rects(screen):
+    """Dibuja cada columna de muro con su propio pygame.draw.rect (renderizador original)."""
+    screen.fill(BLACK)
+    for ray, distance in enumerate(z_buffer.tolist()):
         wall_height = int(HEIGHT / distance)
         shade = 255 / (1 + distance * distance * 0.1)
         color = (shade, shade, shade)
         pygame.draw.rect(screen, color, (ray * SCALE, (HEIGHT - wall_height) // 2, SCALE, wall_height))
 
+def draw_wall_framebuffer(screen):
+    """
+    Escribe todas las columnas de muro en el framebuffer y lo vuelca a la
+    pantalla con un único blit. El sombreado sale de SHADE_LUT_PIXELS en lugar
+    de calcularse por columna, y como el framebuffer cubre toda la pantalla no
+    hace falta limpiarla antes con screen.fill.
+    """
+    wall_heights = (HEIGHT / z_buffer).astype(np.int64)
+    shade_index = np.minimum((z_buffer * SHADE_STEPS_PER_UNIT + 0.5).astype(np.intp), SHADE_LUT.size - 1)
+    shades = SHADE_LUT_PIXELS[shade_index]
+
+    # Máscara (fila, rayo) de los píxeles cubiertos por el muro de cada rayo
+    np.less_equal(camera.row_min_height[:, None], wall_heights, out=_span_mask)
+
+    # pixels2d tiene ejes (x, y); su traspuesta es contigua en memoria.
+    # La vista bloquea la superficie, así que se libera antes del blit.
+    pixels = pygame.surfarray.pixels2d(get_frame_surface()).T
+    if FLOOR_MODE == "none":
+        np.multiply(_span_mask, shades, out=pixels)
+    else:
+        cast_floor(pixels)
+        np.copyto(pixels, shades, where=_span_mask)
+    del pixels
+    blit_frame(screen)
+
+def get_frame_surface():
+    """Framebuffer de NUM_RAYS x HEIGHT (se crea al primer uso tras configure_rays)."""
+    global frame_surface
+    if frame_surface is None:
+        frame_surface = pygame.Surface((NUM_RAYS, HEIGHT), 0, 32, (0xFF0000, 0x00FF00, 0x0000FF, 0))
+    return frame_surface
+
+def blit_frame(screen):
+    """Vuelca el framebuffer a la pantalla (escalado si hay menos rayos que columnas)."""
+    if NUM_RAYS == WIDTH:
+        screen.blit(frame_surface, (0, 0))
+    else:
+        pygame.transform.scale(frame_surface, (WIDTH, HEIGHT), screen)
+
+TEXTURE_SIZE = 64  # Lado de las texturas de muro y suelo (potencia de 2)
+FLOOR_MODE = "fog"  # Suelo y techo: "none" (negro), "fog" (degradado por distancia) o "textured"
+FLOOR_COLOR = (90, 80, 70)
+CEILING_COLOR = (45, 45, 60)
+FLOOR_SHADE_LEVELS = 64  # Niveles de sombreado precalculados para el suelo texturizado
+_floor_textures = None
+
+def make_tile_texture(size=TEXTURE_SIZE, seed=1):
+    """Textura procedural de baldosas (mismo formato que make_brick_texture)."""
+    rng = np.random.default_rng(seed)
+    u, v = np.mgrid[0:size, 0:size]
+    tile = max(2, size // 2)
+    joint = (u % tile == 0) | (v % tile == 0)
+    checker = ((u // tile + v // tile) % 2) * 12
+    noise = rng.integers(-10, 11, (size, size))
+    gray = np.where(joint, 60, 120 + checker + noise)
+    rgb = np.clip(np.stack((gray + 6, gray, gray - 8), axis=-1), 0, 255).astype(np.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+def _shaded_stack(texture):
+    """Copias aplanadas de 'texture' con FLOOR_SHADE_LEVELS niveles de sombreado, de oscura a original."""
+    rgb = _unpack_rgb(texture.reshape(-1))
+    factors = np.arange(FLOOR_SHADE_LEVELS) / (FLOOR_SHADE_LEVELS - 1)
+    return _pack_rgb(factors[:, None, None] * rgb[None]).reshape(-1)
+
+def cast_floor(pixels):
+    """
+    Escribe el suelo y el techo en 'pixels' (vista fila x columna del
+    framebuffer); los muros se dibujan encima.
+
+    En modo "fog" cada fila es un color fijo que se oscurece con la
+    distancia (tabla de la cámara). En modo "textured" se proyecta cada
+    píxel al suelo: con la distancia de su fila (tabla de la cámara, que
+    solo cambia con la ventana) y la dirección de su rayo se obtienen de
+    una vez las coordenadas de mundo de todos los píxeles, y de ellas el
+    texel, que se lee de una copia ya sombreada de la textura. El techo es
+    la imagen especular del suelo, así que reutiliza las mismas
+    coordenadas. Las filas que tapan los muros en todas las columnas no
+    se calculan.
+    """
+    global _floor_textures
+    if FLOOR_MODE == "none":
+        pixels[:] = 0
+        return
+    if FLOOR_MODE == "fog":
+        pixels[:] = camera.fog_rows[:, None]
+        return
+
+    if _floor_textures is None:
+        tiles = make_tile_texture()
+        _floor_textures = (_shaded_stack(tiles), _shaded_stack(_pack_rgb(_unpack_rgb(tiles) * 0.5)))
+    floor_stack, ceiling_stack = _floor_textures
+    half = HEIGHT // 2
+    h_min = int(HEIGHT / z_buffer.max())
+    top = (HEIGHT - h_min) // 2
+    first = max(0, min(top + h_min - half, HEIGHT - half - top))
+    if first >= HEIGHT - half:
+        return
+
+    # En float32/int32 y operando in situ: son dos arrays del tamaño de media pantalla por fotograma
+    distances = camera.row_distance[first:, None].astype(np.float32)
+    u = distances * (camera.dir_x * TEXTURE_SIZE).astype(np.float32)
+    u += np.float32(player_x * TEXTURE_SIZE)
+    v = distances * (camera.dir_y * TEXTURE_SIZE).astype(np.float32)
+    v += np.float32(player_y * TEXTURE_SIZE)
+    texel = u.astype(np.int32)
+    texel &= TEXTURE_SIZE - 1
+    texel *= TEXTURE_SIZE
+    v_texel = v.astype(np.int32)
+    v_texel &= TEXTURE_SIZE - 1
+    texel |= v_texel
+    texel += (camera.row_shade_level[first:] * (TEXTURE_SIZE * TEXTURE_SIZE)).astype(np.int32)[:, None]
+    np.take(floor_stack, texel, out=pixels[half + first:], mode="clip")
+    np.take(ceiling_stack, texel, out=pixels[HEIGHT - 1 - half - first::-1], mode="clip")
+
+TEXTURE_STRIP_CACHE_SIZE = 16384  # Columnas escaladas en caché (al llenarse se vacía)
+
+def make_brick_texture(size=TEXTURE_SIZE, seed=0):
+    """
+    Textura procedural de ladrillos: array (size, size) de píxeles 0xRRGGBB
+    indexado [u, v], de modo que cada columna de la textura es contigua.
+    """
+    rng = np.random.default_rng(seed)
+    u, v = np.mgrid[0:size, 0:size]
+    brick_h = max(2, size // 8)
+    brick_w = max(4, size // 4)
+    row = v // brick_h
+    shifted = u + (row % 2) * (brick_w // 2)  # Hileras alternas desplazadas medio ladrillo
+    mortar = (v % brick_h == 0) | (shifted % brick_w == 0)
+    tint = rng.integers(-25, 26, (size // brick_h + 1, size // brick_w + 2))[row, shifted // brick_w]
+    noise = rng.integers(-12, 13, (size, size))
+    r = np.where(mortar, 165, 150 + tint + noise)
+    g = np.where(mortar, 160, 70 + tint // 2 + noise)
+    b = np.where(mortar, 150, 55 + noise)
+    rgb = np.clip(np.stack((r, g, b), axis=-1), 0, 255).astype(np.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+def _unpack_rgb(pixels):
+    return np.stack(((pixels >> 16) & 0xFF, (pixels >> 8) & 0xFF, pixels & 0xFF), axis=-1).astype(np.float64)
+
+def _pack_rgb(rgb):
+    rgb = np.clip(rgb + 0.5, 0, 255).astype(np.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+def build_mipmaps(texture):
+    """Niveles de detalle de una textura cuadrada: cada uno promedia bloques 2x2 del anterior, hasta 1x1."""
+    levels = [np.ascontiguousarray(texture)]
+    rgb = _unpack_rgb(texture)
+    while rgb.shape[0] > 1:
+        rgb = (rgb[0::2, 0::2] + rgb[1::2, 0::2] + rgb[0::2, 1::2] + rgb[1::2, 1::2]) / 4
+        levels.append(np.ascontiguousarray(_pack_rgb(rgb)))
+    return levels
+
+class TexturedWalls:
+    """
+    Muros con textura sobre el framebuffer, a partir de lo que deja el DDA
+    (z_buffer, wall_u y wall_side). La textura 0 se usa en los bordes
+    verticales y la 1 (la misma, oscurecida) en los horizontales.
+
+    Cada columna de pantalla es una sola copia de un array: la tira ya
+    escalada, recortada a la pantalla y sombreada sale de una caché con
+    clave (textura, u, altura). Para que la caché sirva de un fotograma a
+    otro, la altura se agrupa conservando 7 bits significativos (error
+    menor del 1,6 %; las paredes de menos de 128 píxeles van exactas). El
+    nivel de mip y el sombreado dependen solo de esa altura: se toma el
+    nivel con aproximadamente un texel por píxel, así que las paredes
+    lejanas no parpadean, y u se redondea al texel de ese nivel.
+    """
+
+    def __init__(self, textures, cache_size=TEXTURE_STRIP_CACHE_SIZE):
+        self.mips = [build_mipmaps(texture) for texture in textures]
+        self.size = textures[0].shape[0]
+        self.max_level = len(self.mips[0]) - 1
+        self.cache_size = cache_size
+        self.cache = {}
+        self.key = None
+
+    def _strip(self, key):
+        """Crea la tira de la clave (textura, u, altura) y la guarda en la caché."""
+        texture, u, height = key
+        level = min(self.max_level, max(0, (self.size // height).bit_length() - 1))
+        column = self.mips[texture][level][u]
+        top = (HEIGHT - height) // 2
+        rows = np.arange(max(0, top), min(HEIGHT, top + height))
+        texels = column[(rows - top) * column.size // height]
+        shade = SHADE_LUT[min(int(HEIGHT / height * SHADE_STEPS_PER_UNIT + 0.5), SHADE_LUT.size - 1)]
+        strip = _pack_rgb(_unpack_rgb(texels) * (shade / 255))
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[key] = strip
+        return strip
+
+    def draw(self, pixels):
+        """Escribe en 'pixels' (vista fila x columna del framebuffer) la columna texturizada de cada rayo."""
+        if self.key != HEIGHT:
+            self.key = HEIGHT  # Las tiras dependen del alto de la pantalla
+            self.cache.clear()
+        heights = np.clip(HEIGHT / z_buffer, 1, 1 << 20).astype(np.int64)
+        shift = np.maximum(np.frexp(heights)[1] - 7, 0)
+        heights = heights >> shift << shift
+        levels = np.clip(np.frexp(self.size // heights)[1] - 1, 0, self.max_level)
+        texels = self.size >> levels
+        us = np.minimum((wall_u * texels).astype(np.int64), texels - 1)
+        tops = np.maximum((HEIGHT - heights) // 2, 0).tolist()
+
+        cast_floor(pixels)
+        cache = self.cache
+        for ray, key in enumerate(zip(wall_side.tolist(), us.tolist(), heights.tolist())):
+            strip = cache.get(key)
+            if strip is None:
+                strip = self._strip(key)
+            top = tops[ray]
+            pixels[top:top + strip.size, ray] = strip
+
+wall_textures = None  # TexturedWalls; se crea al dibujar el primer muro texturizado
+
+def draw_wall_textured(screen):
+    """Renderizador "textured": muros con textura en el framebuffer y un único blit."""
+    global wall_textures
+    if wall_textures is None:
+        bricks = make_brick_texture()
+        dark = _pack_rgb(_unpack_rgb(bricks) * 0.7)  # Caras horizontales algo más oscuras
+        wall_textures = TexturedWalls([bricks, dark])
+    pixels = pygame.surfarray.pixels2d(get_frame_surface())
+    wall_textures.draw(pixels.T)
+    del pixels
+    blit_frame(screen)
+def draw_walls(screen):
+    """Renderiza las paredes utilizando el algoritmo DDA y actualiza el z-buffer."""
+    if RAYCAST_BACKEND == "python":
+        cast_rays_python()
+        # El motor python no usa las tablas de la cámara, pero el relleno de
+        # columnas sí: se ponen al día igual que con el motor numpy
+        camera.ray_directions(player_angle)
+    else:
+        cast_rays_numpy()
+
+    if WALL_RENDERER == "rects":
+        draw_wall_rects(screen)
+    elif WALL_RENDERER == "textured":
+        draw_wall_textured(screen)
+    else:
+        draw_wall_framebuffer(screen)
+
+def raycast_poses(samples, seed=0):
+    """Lista de 'samples' poses (x, y, ángulo) aleatorias, con semilla, dentro de celdas abiertas del mapa."""
+    rng = random.Random(seed)
+    open_cells = [(int(x), int(y)) for y, x in np.argwhere(ensure_game_map() == OPEN_CELL)]
+    poses = []
+    for _ in range(samples):
+        cx, cy = rng.choice(open_cells)
+        poses.append((cx + rng.random(), cy + rng.random(), rng.uniform(-math.pi, math.pi)))
+    return poses
+
+def compare_raycast_backends(samples=200):
+    """
+    Compara los motores de raycasting "python" y "numpy" desde posiciones
+    y ángulos aleatorios del mapa. Informa la diferencia máxima del z-buffer,
+    las columnas cuya altura de muro difiere y el tiempo medio por fotograma.
+    """
+    global player_x, player_y, player_angle
+    saved = (player_x, player_y, player_angle)
+    poses = raycast_poses(samples)
+
+    max_diff = 0.0
+    column_mismatches = 0
+    for player_x, player_y, player_angle in poses:
+        cast_rays_python()
+        reference = z_buffer.copy()
+        cast_rays_numpy()
+        max_diff = max(max_diff, float(np.max(np.abs(z_buffer - reference))))
+        column_mismatches += int(np.count_nonzero(
+            (HEIGHT / z_buffer).astype(int) != (HEIGHT / reference).astype(int)))
+
+    timings = {}
+    for name, cast in (("python", cast_rays_python), ("numpy", cast_rays_numpy)):
+        start = time.perf_counter()
+        for player_x, player_y, player_angle in poses:
+            cast()
+        timings[name] = (time.perf_counter() - start) / samples * 1000.0
+
+    player_x, player_y, player_angle = saved
+    print(f"Diferencia máxima en el z-buffer: {max_diff:.3e}")
+    print(f"Columnas con distinta altura de muro: {column_mismatches} de {samples * NUM_RAYS}")
+    for name, ms in timings.items():
+        print(f"  {name:>6}: {ms:.3f} ms por fotograma")
+    print(f"Aceleración: x{timings['python'] / timings['numpy']:.1f}")
+
 # =====================================================
 # E. PROYECTILES: DISPAROS DEL JUGADOR
 # (Mejoras en la detección de impactos y visibilidad)
 # =====================================================
 
-def draw_player_shots(screen):
-    """
-    Dibuja los disparos del jugador en la vista 3D.
-    Cada disparo se proyecta según su ángulo y distancia al jugador.
-    Se asegura que el tamaño del disparo tenga un valor mínimo para mejorar su visibilidad.
-    """
-    for shot in player_shots:
-        dx = shot["x"] - player_x
-        dy = shot["y"] - player_y
-        distance = math.hypot(dx, dy)
-        if distance == 0:
-            continue
-        angle_to_shot = math.atan2(dy, dx)
-        angle_diff = angle_to_shot - player_angle
-        while angle_diff > math.pi:
-            angle_diff -= 2 * math.pi
-        while angle_diff < -math.pi:
-            angle_diff += 2 * math.pi
-        if abs(angle_diff) < HALF_FOV:
-            proj_x = (angle_diff + HALF_FOV) / FOV * WIDTH
-            # Se impone un tamaño mínimo para garantizar la visibilidad del proyectil
-            shot_size = max(int(HEIGHT / distance), 5)
-            proj_y = (HEIGHT - shot_size) // 2
-            pygame.draw.rect(screen, YELLOW, (proj_x - shot_size // 4, proj_y, shot_size // 2, shot_size))
-
-def update_player_shots():
+def update_player_shots(state, events):
     """
     Actualiza la posición de los disparos del jugador y comprueba
     la colisión con los enemigos usando el rectángulo completo de cada enemigo como hitbox.
-    Si el disparo toca el rectángulo, se elimina el enemigo y el disparo.
+    La colisión es continua: se comprueba todo el tramo recorrido en el paso,
+    no solo la celda final, así que un disparo rápido no atraviesa muros ni
+    enemigos. El disparo se detiene en lo primero que encuentra en su camino:
+    si es un enemigo, se eliminan el enemigo y el disparo.
+    Todos los disparos se mueven y se comprueban a la vez con arrays de NumPy.
     """
-    global player_shots, enemies
-    new_shots = []
     enemy_size = 0.8  # Tamaño del rectángulo de colisión del enemigo (ancho y alto)
     half_size = enemy_size / 2.0
+    player_shots = state.player_shots
+    enemies = state.enemies
+    if player_shots.count == 0:
+        return
 
-    for shot in player_shots:
-        # Actualiza la posición del disparo
-        shot["x"] += math.cos(shot["angle"]) * player_shot_speed
-        shot["y"] += math.sin(shot["angle"]) * player_shot_speed
-        
-        xi = int(shot["x"])
-        yi = int(shot["y"])
-        
-        # Comprobación de límites y colisión con muros
-        if xi < 0 or xi >= MAP_WIDTH or yi < 0 or yi >= MAP_HEIGHT or game_map[yi][xi] == "1":
-            wall_hit_sound.play()
+    player_shots.move()
+    x0, y0, x1, y1 = player_shots.segments()
+
+    # Comprobación de límites y colisión con muros a lo largo del tramo
+    t_wall = segment_wall_hits(state.map, x0, y0, x1, y1)
+
+    # Colisión con enemigos: cada disparo elimina al primer enemigo de su
+    # camino que esté antes que el muro y que no haya eliminado ya otro disparo.
+    removed = np.zeros(player_shots.count, dtype=bool)
+    hit_enemies = np.zeros(enemies.count, dtype=bool)
+    state.enemy_index.rebuild(enemies)
+    shot_ids, enemy_ids, t_enemy = state.enemy_index.segment_box_query(x0, y0, x1, y1, half_size)
+    t_wall_list = t_wall.tolist()
+    for shot, enemy, t in zip(shot_ids.tolist(), enemy_ids.tolist(), t_enemy.tolist()):
+        if removed[shot] or hit_enemies[enemy] or t > t_wall_list[shot]:
             continue
+        hit_enemies[enemy] = True
+        removed[shot] = True  # Descartamos el disparo que impactó
+        events.append("enemy_hit")
 
-        # Colisión con enemigos: se define el rectángulo de colisión del enemigo
-        hit_enemy = None
-        for enemy in enemies:
-            left   = enemy["x"] - half_size
-            right  = enemy["x"] + half_size
-            top    = enemy["y"] - half_size
-            bottom = enemy["y"] + half_size
-            if left <= shot["x"] <= right and top <= shot["y"] <= bottom:
-                hit_enemy = enemy
-                break
+    hit_wall = np.isfinite(t_wall) & ~removed
+    events.extend(["wall_hit"] * int(np.count_nonzero(hit_wall)))
 
-        if hit_enemy:
-            enemy_hit_sound.play()
-            enemies.remove(hit_enemy)
-            continue  # Descartamos el disparo que impactó
-
-        new_shots.append(shot)
-    
-    player_shots[:] = new_shots
+    enemies.remove_mask(hit_enemies)
+    player_shots.remove_mask(removed | hit_wall)
 
 # =====================================================
 # E. PROYECTILES Y COMPORTAMIENTO DE ENEMIGOS
 # =====================================================
 
-def enemy_sees_player(enemy):
+def line_of_sight(level, x0, y0, x1, y1):
     """
-    Determina si el enemigo tiene línea de visión hacia el jugador usando un algoritmo DDA.
-    Se traza una línea desde el enemigo al jugador y si en algún punto se encuentra un muro ('1'),
-    se considera que la vista está bloqueada.
+    Indica si el segmento (x0, y0) -> (x1, y1) no atraviesa ningún muro de 'level'.
+    Recorre exactamente las celdas que cruza el segmento (Amanatides-Woo), así
+    que el coste es proporcional a las celdas cruzadas. Si el segmento pasa
+    justo por una esquina, basta con que una de las dos celdas que la forman
+    sea muro para bloquear la vista. Es la versión de referencia, segmento a
+    segmento, de lines_of_sight.
     """
-    ex, ey = enemy["x"], enemy["y"]
-    dx = player_x - ex
-    dy = player_y - ey
-    distance = math.hypot(dx, dy)
-    if distance == 0:
+    cx = math.floor(x0)
+    cy = math.floor(y0)
+    end_x = math.floor(x1)
+    end_y = math.floor(y1)
+    remaining = abs(end_x - cx) + abs(end_y - cy)
+    if remaining == 0:
         return True
-    step = 0.1  # Resolución de la comprobación
-    steps = int(distance / step)
-    for i in range(steps):
-        check_x = ex + dx * (i / steps)
-        check_y = ey + dy * (i / steps)
-        ix = int(check_x)
-        iy = int(check_y)
-        if ix < 0 or ix >= MAP_WIDTH or iy < 0 or iy >= MAP_HEIGHT:
-            continue
-        if game_map[iy][ix] == "1":
+
+    dx = x1 - x0
+    dy = y1 - y0
+    step_x = 1 if dx > 0 else -1
+    step_y = 1 if dy > 0 else -1
+    t_delta_x = abs(1 / dx) if dx != 0 else math.inf
+    t_delta_y = abs(1 / dy) if dy != 0 else math.inf
+    t_max_x = ((cx + 1 - x0) if dx > 0 else (x0 - cx)) * t_delta_x if dx != 0 else math.inf
+    t_max_y = ((cy + 1 - y0) if dy > 0 else (y0 - cy)) * t_delta_y if dy != 0 else math.inf
+
+    while remaining > 0:
+        if t_max_x < t_max_y:
+            cx += step_x
+            t_max_x += t_delta_x
+            remaining -= 1
+        elif t_max_y < t_max_x:
+            cy += step_y
+            t_max_y += t_delta_y
+            remaining -= 1
+        else:
+            # Cruce exacto por una esquina
+            if level.is_wall(cx + step_x, cy) or level.is_wall(cx, cy + step_y):
+                return False
+            cx += step_x
+            cy += step_y
+            t_max_x += t_delta_x
+            t_max_y += t_delta_y
+            remaining -= 2
+        if level.is_wall(cx, cy):
             return False
     return True
 
-def update_enemy_projectiles():
+def lines_of_sight(level, xs, ys, x1, y1):
+    """
+    Versión por lotes de line_of_sight: evalúa a la vez los segmentos que van
+    desde cada punto (xs[i], ys[i]) hasta (x1, y1) y devuelve un array booleano.
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    cx = np.floor(xs).astype(np.intp)
+    cy = np.floor(ys).astype(np.intp)
+    remaining = np.abs(math.floor(x1) - cx) + np.abs(math.floor(y1) - cy)
+
+    dx = x1 - xs
+    dy = y1 - ys
+    step_x = np.where(dx > 0, 1, -1)
+    step_y = np.where(dy > 0, 1, -1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_delta_x = np.where(dx != 0, np.abs(1 / dx), np.inf)
+        t_delta_y = np.where(dy != 0, np.abs(1 / dy), np.inf)
+        t_max_x = np.where(dx != 0, np.where(dx > 0, cx + 1 - xs, xs - cx) * t_delta_x, np.inf)
+        t_max_y = np.where(dy != 0, np.where(dy > 0, cy + 1 - ys, ys - cy) * t_delta_y, np.inf)
+
+    visible = np.ones(xs.size, dtype=bool)
+    active = np.flatnonzero(remaining > 0)
+    while active.size:
+        tmx = t_max_x[active]
+        tmy = t_max_y[active]
+        along_x = tmx <= tmy
+        along_y = tmy <= tmx
+
+        # Cruce exacto por una esquina: se bloquea si cualquiera de las dos celdas es muro
+        blocked = np.zeros(active.size, dtype=bool)
+        corner = along_x & along_y
+        if corner.any():
+            c = active[corner]
+            blocked[corner] = level.walls_at(cx[c] + step_x[c], cy[c]) | level.walls_at(cx[c], cy[c] + step_y[c])
+
+        ax = active[along_x]
+        cx[ax] += step_x[ax]
+        t_max_x[ax] += t_delta_x[ax]
+        remaining[ax] -= 1
+        ay = active[along_y]
+        cy[ay] += step_y[ay]
+        t_max_y[ay] += t_delta_y[ay]
+        remaining[ay] -= 1
+
+        blocked |= level.walls_at(cx[active], cy[active])
+        visible[active[blocked]] = False
+        active = active[~blocked & (remaining[active] > 0)]
+    return visible
+
+def enemies_see_player(state):
+    """
+    Indica qué enemigos vivos tienen línea de visión hacia el jugador. El
+    resultado se guarda por celda del enemigo y las celdas que no están en
+    la caché se resuelven juntas con lines_of_sight.
+    """
+    enemies = state.enemies
+    player_x, player_y = state.player_x, state.player_y
+    n = enemies.count
+    level = state.map
+    cache = level.los_cache_for(player_x, player_y)
+    xs = enemies.x[:n]
+    ys = enemies.y[:n]
+    keys = (ys.astype(np.intp) * level.width + xs.astype(np.intp)).tolist()
+    cached = [cache.get(key) for key in keys]
+    missing = [i for i, sees in enumerate(cached) if sees is None]
+    if missing:
+        # Si el PVS descarta la celda del enemigo no hace falta trazar la línea
+        visible = potentially_visible(level, player_x, player_y, xs[missing], ys[missing])
+        if visible is not None:
+            for i in itertools.compress(missing, ~visible):
+                cached[i] = cache[keys[i]] = False
+            missing = list(itertools.compress(missing, visible))
+    if missing:
+        computed = lines_of_sight(level, xs[missing], ys[missing], player_x, player_y).tolist()
+        for i, sees in zip(missing, computed):
+            cached[i] = cache[keys[i]] = sees
+    return np.array(cached, dtype=bool)
+
+def update_enemy_projectiles(state, events):
     """
     Actualiza la posición de los disparos de los enemigos y comprueba colisiones.
     - Se incrementa la posición según su ángulo y velocidad.
-    - Si el proyectil toca un muro o sale de los límites, se reproduce 'wall_hit_sound' y se elimina.
-    - Si el proyectil impacta al jugador (umbral aumentado a 0.5), se reproduce 'player_hit_sound'
+    - Si el proyectil toca un muro o sale de los límites, se reproduce el sonido 'wall_hit' y se elimina.
+    - Si el proyectil impacta al jugador (umbral aumentado a 0.5), se reproduce el sonido 'player_hit'
       y se reduce la vida del jugador.
+    Ambas comprobaciones son continuas sobre el tramo recorrido en el paso y
+    cuenta lo que el proyectil encuentre primero.
+    Todos los proyectiles se procesan a la vez con arrays de NumPy.
     """
-    global enemy_projectiles, player_x, player_y, player_lives
-    new_projectiles = []
-    for proj in enemy_projectiles:
-        proj["x"] += math.cos(proj["angle"]) * enemy_projectile_speed
-        proj["y"] += math.sin(proj["angle"]) * enemy_projectile_speed
-        xi = int(proj["x"])
-        yi = int(proj["y"])
-        if xi < 0 or xi >= MAP_WIDTH or yi < 0 or yi >= MAP_HEIGHT or game_map[yi][xi] == "1":
-            wall_hit_sound.play()
-            continue
-        if math.hypot(proj["x"] - player_x, proj["y"] - player_y) < 0.5:
-            player_hit_sound.play()
-            player_lives -= 1
-            continue
-        new_projectiles.append(proj)
-    enemy_projectiles[:] = new_projectiles
-
-def update_enemies(dt):
+    enemy_projectiles = state.enemy_projectiles
+    if enemy_projectiles.count == 0:
+        return
+    enemy_projectiles.move()
+    x0, y0, x1, y1 = enemy_projectiles.segments()
+    t_wall = segment_wall_hits(state.map, x0, y0, x1, y1)
+
+    # Candidatos: proyectiles cuyo tramo puede pasar a menos de 0.5 del jugador
+    hit_player = np.zeros(enemy_projectiles.count, dtype=bool)
+    state.projectile_index.rebuild(enemy_projectiles)
+    reach = float(np.max(np.hypot(x1 - x0, y1 - y0))) + 0.5
+    near = state.projectile_index.radius_query(state.player_x, state.player_y, reach)
+    t_player = segment_circle_entry(x0[near], y0[near], x1[near], y1[near],
+                                    state.player_x, state.player_y, 0.5)
+    hit_player[near] = t_player < t_wall[near]
+    hit_wall = np.isfinite(t_wall) & ~hit_player
+    events.extend(["wall_hit"] * int(np.count_nonzero(hit_wall)))
+    hits = int(np.count_nonzero(hit_player))
+    events.extend(["player_hit"] * hits)
+    state.lives -= hits
+    enemy_projectiles.remove_mask(hit_wall | hit_player)
+
+def update_enemies(state, dt, events):
     """
     Actualiza el temporizador de visión de cada enemigo.
-    - Si el enemigo tiene línea de visión hacia el jugador (según enemy_sees_player), se incrementa su temporizador.
+    - Si el enemigo tiene línea de visión hacia el jugador (según enemies_see_player), se incrementa su temporizador.
     - Al alcanzar 3 segundos de visión continua, el enemigo dispara un proyectil dirigido al jugador y el temporizador se reinicia.
     """
-    global enemies, enemy_projectiles
-    for enemy in enemies:
-        if enemy_sees_player(enemy):
-            enemy["timer"] += dt
+    enemies = state.enemies
+    n = enemies.count
+    sees = enemies_see_player(state)
+    timers = enemies.timer[:n]
+    timers[:] = np.where(sees, timers + dt, 0.0)
+
+    for i in np.flatnonzero(timers >= 3.0).tolist():
+        timers[i] = 0.0
+        ex, ey = float(enemies.x[i]), float(enemies.y[i])
+        angle = math.atan2(state.player_y - ey, state.player_x - ex)
+        state.enemy_projectiles.add(ex, ey, angle, state.enemy_projectile_speed)
+        events.append("enemy_fired")
+
+# =====================================================
+# E2. ESTADO DE LA PARTIDA Y SIMULACIÓN SIN PYGAME
+# =====================================================
+
+# Simulación a paso fijo: la lógica siempre avanza en pasos de SIM_DT segundos,
+# se dibuje a la velocidad que se dibuje. Las velocidades por paso conservan
+# los valores originales, que eran por fotograma a 60 FPS.
+SIM_DT = 1 / 60
+MAX_FRAME_TIME = 0.25  # Tope de tiempo real simulado por llamada a step, para no entrar en espiral
+CALIZ_MOVE_INTERVAL = 60.0  # Segundos entre recolocaciones del caliz
+
+# Entrada de un paso: acciones del jugador, independientes del teclado.
+# 'fire' dispara una vez al principio del step en que se pasa.
+Inputs = collections.namedtuple("Inputs", "forward back left right fire", defaults=(False,) * 5)
+NO_INPUT = Inputs()
+
+def _no_mark(phase):
+    pass
+
+class GameState:
+    """
+    Estado completo de una partida: jugador, enemigos, proyectiles, caliz y
+    temporizadores, con su propio generador aleatorio (semilla 'seed').
+    step(inputs, dt) avanza la simulación y devuelve la lista de eventos
+    ocurridos ("shot_fired", "enemy_fired", "enemy_hit", "wall_hit",
+    "player_hit", "enemy_spawned", "caliz_moved", "caliz_reached",
+    "game_over"), uno por suceso. No usa pygame: el sonido y el dibujo los
+    hace quien la llama a partir de los eventos y del estado, de modo que se
+    puede simular sin ventana ni audio y más rápido que el tiempo real.
+
+    El mapa es 'level' (un GameMap, con sus cachés), de modo que varias
+    partidas con mapas distintos pueden convivir en un mismo proceso. Por
+    defecto es el instalado con set_game_map; si aún no hay ninguno, se
+    genera al crear la primera partida.
+    """
+
+    def __init__(self, seed=None, start=(1.5, 1.5, 0.0), lives=3, caliz=None, level=None):
+        if level is None:
+            ensure_game_map()
+            level = current_map
+        self.map = level
+        self.rng = random.Random(seed)
+        self.player_x, self.player_y, self.player_angle = start
+        self.prev_pose = start
+        self.lives = lives
+        # Reglas de la partida: por defecto, los valores del módulo
+        self.player_speed = player_speed
+        self.player_turn_speed = player_turn_speed
+        self.player_shot_speed = player_shot_speed
+        self.enemy_projectile_speed = enemy_projectile_speed
+        self.enemy_spawn_interval = enemy_spawn_interval
+
+        self.enemies = EntityPool()
+        self.player_shots = EntityPool()
+        self.enemy_projectiles = EntityPool()
+        self.enemy_index = SpatialHash(self.map.width, self.map.height)
+        self.projectile_index = SpatialHash(self.map.width, self.map.height)
+        self.enemy_spawn_timer = 0.0
+        self.caliz = caliz if caliz is not None else place_caliz(self.map, self.rng)
+        self.caliz_timer = 0.0
+        self.accumulator = 0.0
+        self.ticks = 0
+
+    @property
+    def time(self):
+        """Segundos de juego simulados."""
+        return self.ticks * SIM_DT
+
+    def fire(self, events):
+        """Agrega un disparo del jugador en su posición y dirección actuales."""
+        self.player_shots.add(self.player_x, self.player_y, self.player_angle, self.player_shot_speed)
+        events.append("shot_fired")
+
+    def tick(self, inputs=NO_INPUT, events=None, mark=_no_mark):
+        """Avanza la simulación exactamente un paso de SIM_DT y devuelve los eventos."""
+        if events is None:
+            events = []
+        self.prev_pose = (self.player_x, self.player_y, self.player_angle)
+        move_player(self, inputs)
+        mark("move_player")
+        update_enemies(self, SIM_DT, events)
+        mark("update_enemies")
+        update_player_shots(self, events)
+        mark("update_player_shots")
+        update_enemy_projectiles(self, events)
+        mark("update_enemy_projectiles")
+        update_enemy_spawns(self, SIM_DT, events)
+
+        # Recoloca el caliz cada CALIZ_MOVE_INTERVAL segundos
+        self.caliz_timer += SIM_DT
+        if self.caliz_timer >= CALIZ_MOVE_INTERVAL:
+            self.caliz = place_caliz(self.map, self.rng)
+            self.caliz_timer = 0.0
+            events.append("caliz_moved")
+        mark("spawn_enemies")
+
+        # Victoria si el jugador pasa por encima del caliz (mitad del tamaño del caliz)
+        if (abs(self.player_x - self.caliz["x"]) < (CALIZ_SIZE / 2)
+                and abs(self.player_y - self.caliz["y"]) < (CALIZ_SIZE / 2)):
+            events.append("caliz_reached")
+        if self.lives <= 0:
+            events.append("game_over")
+        self.ticks += 1
+        return events
+
+    def step(self, inputs=NO_INPUT, dt=SIM_DT, mark=_no_mark):
+        """
+        Acumula 'dt' segundos y ejecuta tantos pasos fijos como quepan; lo que
+        sobra queda para el siguiente step (ver alpha). Devuelve los eventos.
+        """
+        events = []
+        if inputs.fire:
+            self.fire(events)
+        self.accumulator += min(dt, MAX_FRAME_TIME)
+        while self.accumulator >= SIM_DT:
+            self.tick(inputs, events, mark)
+            self.accumulator -= SIM_DT
+        return events
+
+    @property
+    def alpha(self):
+        """Fracción (0..1) del siguiente paso ya acumulada, para interpolar al dibujar."""
+        return self.accumulator / SIM_DT
+
+    def render_pose(self, alpha):
+        """Pose del jugador interpolada entre los dos últimos pasos."""
+        prev_x, prev_y, prev_angle = self.prev_pose
+        return (prev_x + (self.player_x - prev_x) * alpha,
+                prev_y + (self.player_y - prev_y) * alpha,
+                prev_angle + (self.player_angle - prev_angle) * alpha)
+
+world = None  # Partida en curso que dibuja y controla el bucle principal (la crea main)
+
+# Tipos de sprite: (almacén de GameState, color, tamaño mínimo en píxeles para que se vean de lejos)
+SPRITE_KINDS = (("enemies", RED, 0),
+                ("player_shots", YELLOW, 5),
+                ("enemy_projectiles", (128, 0, 128), 5))  # Púrpura
+
+def project_sprites(alpha=1.0):
+    """
+    Proyecta en una sola pasada vectorizada los enemigos, los disparos del
+    jugador y los proyectiles enemigos de la partida en curso (world). Descarta los que quedan detrás del
+    jugador o fuera de la pantalla y devuelve, ordenados de atrás hacia
+    delante, los arrays (profundidad, izquierda, tamaño, tipo):
+      profundidad: distancia perpendicular al plano de la cámara, la misma
+                   medida que guarda el z-buffer.
+      izquierda: borde izquierdo en píxeles de pantalla.
+      tamaño: alto del sprite en píxeles (el ancho es la mitad).
+      tipo: índice en SPRITE_KINDS.
+    Las posiciones se interpolan a la fracción 'alpha' del último paso de simulación.
+    """
+    pools = [getattr(world, name) for name, _, _ in SPRITE_KINDS]
+    counts = [pool.count for pool in pools]
+    positions = [pool.interpolated(alpha) for pool in pools]
+    xs = np.concatenate([x for x, _ in positions])
+    ys = np.concatenate([y for _, y in positions])
+    kinds = np.repeat(np.arange(len(SPRITE_KINDS)), counts)
+    # Las entidades en celdas que el PVS no ve desde la del jugador ni se proyectan
+    visible = potentially_visible(world.map, player_x, player_y, xs, ys)
+    if visible is not None:
+        xs, ys, kinds = xs[visible], ys[visible], kinds[visible]
+
+    dx = xs - player_x
+    dy = ys - player_y
+    distance = np.hypot(dx, dy)
+    angle_diff = (np.arctan2(dy, dx) - player_angle + math.pi) % (2 * math.pi) - math.pi
+    front = (distance > 0) & (np.abs(angle_diff) < math.pi / 2)
+    distance, angle_diff, kinds = distance[front], angle_diff[front], kinds[front]
+
+    min_size = np.array([min_px for _, _, min_px in SPRITE_KINDS])[kinds]
+    size = np.maximum(np.minimum(HEIGHT / distance, 64 * HEIGHT).astype(np.int64), min_size)
+    center = (angle_diff + HALF_FOV) / FOV * WIDTH
+    left = np.floor(center - size // 4).astype(np.int64)
+    on_screen = (size >= 2) & (left + size // 2 > 0) & (left < WIDTH)
+
+    depth = (distance * np.cos(angle_diff))[on_screen]
+    order = np.argsort(-depth, kind="stable")
+    return depth[order], left[on_screen][order], size[on_screen][order], kinds[on_screen][order]
+
+def draw_sprites(screen, alpha=1.0):
+    """
+    Dibuja todos los sprites como rectángulos de atrás hacia delante, de modo
+    que los cercanos tapan a los lejanos. Cada sprite se recorta columna a
+    columna contra el z-buffer en todo su ancho: se comparan de una vez todas
+    las columnas de todos los sprites y solo se dibujan los tramos contiguos
+    que quedan delante de las paredes.
+    """
+    depth, left, size, kinds = project_sprites(alpha)
+    if depth.size == 0:
+        return
+    width = size // 2
+
+    # Rango de columnas del z-buffer [first, last) que cubre cada sprite
+    first = np.maximum(np.floor(left / SCALE), 0).astype(np.int64)
+    last = np.minimum(np.ceil((left + width) / SCALE), NUM_RAYS).astype(np.int64)
+    spans = last - first
+    sprite_of = np.repeat(np.arange(depth.size), spans)
+    column = np.arange(sprite_of.size) - np.repeat(np.cumsum(spans) - spans - first, spans)
+    visible = depth[sprite_of] < z_buffer[column]
+
+    # Tramos de columnas visibles consecutivas del mismo sprite
+    same_as_prev = np.zeros(visible.size, dtype=bool)
+    same_as_prev[1:] = visible[:-1] & (sprite_of[1:] == sprite_of[:-1])
+    same_as_next = np.zeros(visible.size, dtype=bool)
+    same_as_next[:-1] = same_as_prev[1:]
+    starts = np.flatnonzero(visible & ~same_as_prev)
+    ends = np.flatnonzero(visible & ~same_as_next)
+
+    sprite = sprite_of[starts]
+    x0 = np.maximum(left[sprite], np.rint(column[starts] * SCALE)).astype(np.int64)
+    x1 = np.minimum(left[sprite] + width[sprite], np.rint((column[ends] + 1) * SCALE)).astype(np.int64)
+    top = ((HEIGHT - size) // 2).tolist()
+    size = size.tolist()
+    colors = [SPRITE_KINDS[k][1] for k in kinds.tolist()]
+    for s, a, b in zip(sprite.tolist(), x0.tolist(), x1.tolist()):
+        if b > a:
+            pygame.draw.rect(screen, colors[s], (a, top[s], b - a, size[s]))
+
+# =====================================================
+# F. PERFILADOR DE FOTOGRAMAS
+# =====================================================
+
+# Fases que run_frame marca, en orden; el bucle principal añade "events" delante
+FRAME_PHASES = ("move_player", "update_enemies", "update_player_shots", "update_enemy_projectiles",
+                "spawn_enemies", "audio", "draw_walls", "draw_sprites", "draw_minimap", "draw_hud", "flip")
+
+PROFILE_OUT = None  # Ruta (.csv o .json) donde se exporta el perfil al salir del juego
+
+class FrameProfiler:
+    """
+    Cronómetros por fase del bucle principal. Guarda en un búfer circular
+    la duración de cada fase de los últimos 'capacity' fotogramas.
+
+    Mientras está desactivado el bucle usa _no_mark, así que medir no cuesta
+    nada; al activarlo (tecla F3 o --profile) el bucle pasa a usar mark y el
+    HUD muestra las medias móviles y el peor fotograma reciente. export()
+    escribe el historial como CSV o como JSON de trace-event de Chrome
+    (se abre en chrome://tracing o Perfetto).
+    """
+
+    PHASES = ("events",) + FRAME_PHASES
+
+    def __init__(self, capacity=3600, window=120):
+        self.enabled = False
+        self.show_hud = False
+        self.window = window
+        self.column = {phase: i for i, phase in enumerate(self.PHASES)}
+        self.starts = np.zeros(capacity)                        # Inicio de cada fotograma (s)
+        self.durations = np.zeros((capacity, len(self.PHASES)))  # Duración de cada fase (s)
+        self.frames = 0  # Fotogramas registrados desde el último reset
+        self._row = np.zeros(len(self.PHASES))
+        self._last = 0.0
+        self._hud = None
+        self._hud_frame = -1
+        self._font = None
+
+    def toggle(self):
+        """Alterna el HUD; si hay que exportar al salir, se sigue midiendo aunque se oculte."""
+        self.show_hud = not self.show_hud
+        was_enabled = self.enabled
+        self.enabled = self.show_hud or PROFILE_OUT is not None
+        if self.enabled and not was_enabled:
+            self.begin_frame()  # Se activa a mitad de fotograma
+
+    def begin_frame(self):
+        self._row.fill(0.0)
+        self._last = time.perf_counter()
+        self.starts[self.frames % len(self.starts)] = self._last
+
+    def mark(self, phase):
+        """Atribuye a 'phase' el tiempo transcurrido desde la marca anterior."""
+        now = time.perf_counter()
+        self._row[self.column[phase]] += now - self._last
+        self._last = now
+
+    def end_frame(self):
+        self.durations[self.frames % len(self.starts)] = self._row
+        self.frames += 1
+
+    def reset(self):
+        self.frames = 0
+        self._hud_frame = -1
+
+    def history(self):
+        """Devuelve (inicios, duraciones) de los fotogramas guardados, del más antiguo al más reciente."""
+        capacity = len(self.starts)
+        if self.frames <= capacity:
+            return self.starts[:self.frames], self.durations[:self.frames]
+        order = np.roll(np.arange(capacity), -(self.frames % capacity))
+        return self.starts[order], self.durations[order]
+
+    def summary(self):
+        """Media móvil por fase y peor fotograma de la ventana reciente, en milisegundos."""
+        _, durations = self.history()
+        recent = durations[-self.window:] * 1000
+        if len(recent) == 0:
+            return None
+        totals = recent.sum(axis=1)
+        worst = int(np.argmax(totals))
+        return {"mean_ms": dict(zip(self.PHASES, recent.mean(axis=0))),
+                "frame_mean_ms": float(totals.mean()),
+                "worst_ms": float(totals[worst]),
+                "worst_phases_ms": dict(zip(self.PHASES, recent[worst]))}
+
+    def draw(self, screen, font_size=16, refresh_frames=15):
+        """
+        Dibuja el HUD del perfilador en la esquina inferior izquierda. El texto
+        se vuelve a componer solo cada 'refresh_frames' fotogramas.
+        """
+        if self._font is None:
+            self._font = pygame.font.SysFont("Arial", font_size)
+        if self._hud is None or self.frames - self._hud_frame >= refresh_frames:
+            self._hud_frame = self.frames
+            self._hud = self._render_hud(self._font)
+        if self._hud is not None:
+            screen.blit(self._hud, (10, HEIGHT - self._hud.get_height() - 10))
+
+    def _render_hud(self, font):
+        stats = self.summary()
+        if stats is None:
+            return None
+        worst_phase = max(stats["worst_phases_ms"], key=stats["worst_phases_ms"].get)
+        title = "fotograma %.2f ms  (peor %.2f ms: %s)  %d rayos" % (
+            stats["frame_mean_ms"], stats["worst_ms"], worst_phase, NUM_RAYS)
+        rows = [(phase, "%.2f ms" % stats["mean_ms"][phase]) for phase in self.PHASES]
+        line_height = font.get_linesize()
+        # Dos columnas: nombre de la fase a la izquierda, media alineada a la derecha
+        name_width = max(font.size(name)[0] for name, _ in rows) + 16
+        value_width = max(font.size(value)[0] for _, value in rows)
+        width = max(font.size(title)[0], name_width + value_width) + 12
+        hud = pygame.Surface((width, line_height * (len(rows) + 1) + 8))
+        hud.set_alpha(200)
+        hud.blit(font.render(title, True, (255, 255, 0)), (6, 4))
+        for i, (name, value) in enumerate(rows, start=1):
+            y = 4 + i * line_height
+            hud.blit(font.render(name, True, WHITE), (6, y))
+            value_surface = font.render(value, True, WHITE)
+            hud.blit(value_surface, (6 + name_width + value_width - value_surface.get_width(), y))
+        return hud
+
+    def export(self, path):
+        """Escribe el historial en 'path': CSV si termina en .csv, trace-event JSON en otro caso."""
+        starts, durations = self.history()
+        if path.lower().endswith(".csv"):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("frame,start_ms,total_ms," + ",".join(p + "_ms" for p in self.PHASES) + "\n")
+                origin = starts[0] if len(starts) else 0.0
+                for i, (start, row) in enumerate(zip(starts, durations)):
+                    values = [(start - origin) * 1000, row.sum() * 1000] + list(row * 1000)
+                    f.write("%d," % i + ",".join("%.4f" % v for v in values) + "\n")
+            return
+        # Cada fase es un evento completo ("X") que empieza donde terminó la anterior
+        offsets = np.cumsum(durations, axis=1) - durations
+        events = []
+        for i, start in enumerate(starts):
+            for j, phase in enumerate(self.PHASES):
+                if durations[i, j] > 0:
+                    events.append({"name": phase, "ph": "X", "pid": 1, "tid": 1,
+                                   "ts": round((start + offsets[i, j]) * 1e6, 1),
+                                   "dur": round(durations[i, j] * 1e6, 1)})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+profiler = FrameProfiler()
+
+# =====================================================
+# F2. RESOLUCIÓN DINÁMICA
+# =====================================================
+
+class ResolutionController:
+    """
+    Ajusta el número de rayos (y con él el ancho de columna, WIDTH / NUM_RAYS)
+    entre min_rays y max_rays para que cada fotograma quepa en 'budget'
+    segundos. configure_rays redimensiona el z-buffer y el framebuffer, y la
+    cámara y los sprites leen NUM_RAYS en cada fotograma, así que el cambio
+    se aplica en el fotograma siguiente.
+
+    update() recibe el tiempo de trabajo del fotograma (sin la espera del
+    reloj) y lleva una media exponencial. Para no parpadear hay histéresis:
+    - baja si la media pasa del presupuesto durante 'patience' fotogramas
+      seguidos, en proporción al exceso;
+    - sube de 'step' en 'step' rayos solo si la media queda por debajo de
+      headroom * budget durante 4 * patience fotogramas;
+    - tras cada cambio, la media se reinicia y se esperan 'patience'
+      fotogramas antes de volver a decidir.
+    """
+
+    def __init__(self, budget=1 / 60, min_rays=WIDTH // 4, max_rays=WIDTH, step=16,
+                 headroom=0.7, patience=15, smoothing=0.1):
+        self.enabled = False
+        self.budget = budget
+        self.min_rays = min_rays
+        self.max_rays = max_rays
+        self.step = step
+        self.headroom = headroom
+        self.patience = patience
+        self.smoothing = smoothing
+        self.reset()
+
+    def reset(self):
+        self.average = None
+        self.frames = 0  # Fotogramas desde el último cambio
+        self.over = 0    # Fotogramas seguidos por encima del presupuesto
+        self.under = 0   # Fotogramas seguidos holgadamente por debajo
+
+    def clamp(self, num_rays):
+        """Redondea a un múltiplo de 'step' dentro de [min_rays, max_rays]."""
+        return max(self.min_rays, min(self.max_rays, num_rays // self.step * self.step))
+
+    def update(self, frame_time):
+        """Registra la duración de un fotograma; devuelve el nuevo número de rayos si lo ha cambiado."""
+        if not self.enabled:
+            return None
+        if self.average is None:
+            self.average = frame_time
         else:
-            enemy["timer"] = 0.0
-
-        if enemy["timer"] >= 3.0:
-            enemy["timer"] = 0.0
-            dx = player_x - enemy["x"]
-            dy = player_y - enemy["y"]
-            angle = math.atan2(dy, dx)
-            enemy_projectiles.append({"x": enemy["x"], "y": enemy["y"], "angle": angle})
-            # Se reproduce el sonido del disparo al generar el proyectil del enemigo
-            ray_sound.play()
-
-def draw_enemies(screen):
-    """
-    Renderiza a los enemigos en la vista 3D como rectángulos rojos.
-    Se calcula la proyección en función de la distancia y del ángulo relativo al jugador.
-    Se utiliza el z-buffer para evitar que se dibujen sobre paredes (si están detrás de ellas).
-    """
-    for enemy in enemies:
-        dx = enemy["x"] - player_x
-        dy = enemy["y"] - player_y
-        distance = math.hypot(dx, dy)
-        if distance == 0:
-            continue
-        angle_to_enemy = math.atan2(dy, dx)
-        angle_diff = angle_to_enemy - player_angle
-        while angle_diff > math.pi:
-            angle_diff -= 2 * math.pi
-        while angle_diff < -math.pi:
-            angle_diff += 2 * math.pi
-        if abs(angle_diff) < HALF_FOV:
-            proj_x = (angle_diff + HALF_FOV) / FOV * WIDTH
-            enemy_height = int(HEIGHT / distance)
-            proj_y = (HEIGHT - enemy_height) // 2
-            ray_index = int((angle_diff + HALF_FOV) / FOV * NUM_RAYS)
-            ray_index = max(0, min(NUM_RAYS - 1, ray_index))
-            if distance < z_buffer[ray_index]:
-                pygame.draw.rect(screen, RED, (proj_x - enemy_height // 4, proj_y, enemy_height // 2, enemy_height))
-
-def draw_enemy_projectiles(screen):
-    """
-    Dibuja los disparos de los enemigos en la vista 3D como pequeños rectángulos púrpuras.
-    Se utiliza el z-buffer para verificar que el proyectil no se dibuje si está oculto tras una pared.
-    Se impone un tamaño mínimo para asegurar la visibilidad.
-    """
-    enemy_proj_color = (128, 0, 128)  # Color púrpura
-    for proj in enemy_projectiles:
-        dx = proj["x"] - player_x
-        dy = proj["y"] - player_y
-        distance = math.hypot(dx, dy)
-        if distance == 0:
-            continue
-        angle_to_proj = math.atan2(dy, dx)
-        angle_diff = angle_to_proj - player_angle
-        while angle_diff > math.pi:
-            angle_diff -= 2 * math.pi
-        while angle_diff < -math.pi:
-            angle_diff += 2 * math.pi
-        if abs(angle_diff) < HALF_FOV:
-            proj_x = (angle_diff + HALF_FOV) / FOV * WIDTH
-            proj_size = max(int(HEIGHT / distance), 5)  # Tamaño mínimo para buena visibilidad
-            proj_y = (HEIGHT - proj_size) // 2
-            ray_index = int((angle_diff + HALF_FOV) / FOV * NUM_RAYS)
-            ray_index = max(0, min(NUM_RAYS - 1, ray_index))
-            if distance < z_buffer[ray_index]:
-                pygame.draw.rect(screen, enemy_proj_color, (proj_x - proj_size // 4, proj_y, proj_size // 2, proj_size))
+            self.average += self.smoothing * (frame_time - self.average)
+        self.frames += 1
+        if self.frames < self.patience:
+            return None
+        self.over = self.over + 1 if self.average > self.budget else 0
+        self.under = self.under + 1 if self.average < self.headroom * self.budget else 0
+
+        num_rays = NUM_RAYS
+        if self.over >= self.patience:
+            # Parte del coste no depende de los rayos: se recorta como mucho a la mitad
+            num_rays = self.clamp(int(NUM_RAYS * max(0.5, min(0.9, self.budget / self.average))))
+        elif self.under >= 4 * self.patience:
+            num_rays = self.clamp(NUM_RAYS + self.step)
+        if num_rays == NUM_RAYS:
+            return None
+        configure_rays(num_rays)
+        self.reset()
+        return num_rays
+
+resolution = ResolutionController()
+
 # =====================================================
 # G. BUCLE PRINCIPAL DEL JUEGO
 # =====================================================
 
+# Sonido que corresponde a cada evento de la simulación
+EVENT_SOUNDS = {"shot_fired": "ray", "enemy_fired": "ray", "enemy_hit": "enemy_hit",
+                "wall_hit": "wall_hit", "player_hit": "player_hit"}
+
+def inputs_from_keys(keys, fire=False):
+    """Traduce el estado del teclado de pygame (pygame.key.get_pressed()) a Inputs."""
+    return Inputs(forward=bool(keys[pygame.K_UP]), back=bool(keys[pygame.K_DOWN]),
+                  left=bool(keys[pygame.K_LEFT]), right=bool(keys[pygame.K_RIGHT]), fire=fire)
+
+def run_frame(screen, dt, inputs, mark=_no_mark):
+    """
+    Ejecuta un fotograma: los pasos de simulación de la partida en curso que
+    correspondan a 'dt', sus sonidos, el renderizado de la escena 3D,
+    minimapa, HUD y volcado a pantalla. Devuelve los eventos de la simulación.
+    Tras cada fase se llama a mark(nombre_de_la_fase), lo que permite medir
+    cuánto tarda cada una sin modificar el bucle.
+    """
+    global player_x, player_y, player_angle
+    # Actualización de estados
+    events = world.step(inputs, dt, mark)
+    for event in events:
+        sound = EVENT_SOUNDS.get(event)
+        if sound:
+            sounds.play(sound)
+    sounds.flush()  # Un disparo por sonido pedido en este fotograma
+    mark("audio")
+
+    # Se dibuja con la pose del jugador interpolada entre los dos últimos pasos
+    alpha = world.alpha
+    player_x, player_y, player_angle = world.render_pose(alpha)
+
+    # Renderizado de la escena 3D, del mapa de la partida en curso
+    set_game_map(world.map)
+    draw_walls(screen)
+    mark("draw_walls")
+    draw_sprites(screen, alpha)  # Enemigos, disparos del jugador y proyectiles enemigos
+    mark("draw_sprites")
+
+    if show_map:
+        draw_minimap(screen, scale=6)
+    mark("draw_minimap")
+
+    # HUD: muestra las vidas como cuadrados rojos en la esquina superior derecha
+    draw_lives(screen, world.lives)
+
+    # Dibuja el caliz (con el mismo factor de escala usado en el minimapa)
+    draw_caliz(screen, world.caliz, scale=6, origin=minimap.origin())
+    if transition.active:
+        transition.draw(screen)
+    if profiler.show_hud:
+        profiler.draw(screen)
+    mark("draw_hud")
+
+    pygame.display.flip()
+    mark("flip")
+    return events
+
 def main():
-    global enemy_spawn_timer, player_lives, player_x, player_y, player_angle, show_map, player_shots, enemies, caliz, caliz_timer
-    pygame.init()
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
-    pygame.display.set_caption("ENTropia 3D")
+    global world, show_map
+    screen = init_display()
     
     # Inicia la música de fondo
     play_background_music()
     
-    # Pantalla de inicio y efecto de transición
+    # Pantalla de inicio; el fundido hacia la partida lo lleva el bucle principal
+    STARTUP_TIMES.setdefault("to_menu", time.perf_counter() - _IMPORT_START)
+    # El laberinto y su PVS se preparan mientras el menú espera al jugador
+    ensure_game_map()
+    start_pvs_build()
     start_screen(screen)
-    transition_effect(screen)
+    transition.start(screen)
     
-    # Reinicia las variables para comenzar una nueva partida
-    enemy_spawn_timer = 0.0
-    player_lives = 3
-    player_x, player_y = 1.5, 1.5  # Posición inicial (ajusta según tu mapa)
-    player_angle = 0.0
+    # Nueva partida: jugador en la posición inicial, sin enemigos y con el caliz colocado
+    game_start = time.perf_counter()
+    world = GameState()
+    setup_time = time.perf_counter() - game_start
     show_map = False
-    player_shots = []
-    enemies = []
-    
-    # Coloca el caliz en el mapa y reinicia su timer
-    caliz = place_caliz()
-    caliz_timer = 0.0
     
     clock = pygame.time.Clock()
     running = True
@@ -770,23 +2957,11 @@ def main():
     
     while running:
         dt = clock.tick(60) / 1000.0  # Delta time en segundos
-        
-        # Actualiza el timer del caliz y reposiciónalo cada 60 segundos
-        caliz_timer += dt
-        if caliz_timer >= 60:
-            caliz = place_caliz()
-            caliz_timer = 0.0
-        
-        # Detección de victoria: si el jugador pasa por encima del caliz
-        # Se compara la posición del jugador y el centro del caliz usando la mitad del tamaño del caliz
-        if (abs(player_x - caliz["x"]) < (CALIZ_SIZE / 2)) and (abs(player_y - caliz["y"]) < (CALIZ_SIZE / 2)):
-            print("¡Has ganado!")
-            win_screen(screen)
-            # Reiniciamos el juego completamente para comenzar una nueva partida
-            main()
-            return
+        if profiler.enabled:
+            profiler.begin_frame()
         
         # Procesamiento de eventos
+        fire = False
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
@@ -794,13 +2969,10 @@ def main():
                 if event.key == pygame.K_ESCAPE:
                     running = False
                 elif event.key == pygame.K_SPACE:
-                    # Agrega un disparo del jugador
-                    player_shots.append({
-                        "x": player_x,
-                        "y": player_y,
-                        "angle": player_angle
-                    })
-                    ray_sound.play()
+                    fire = True  # El disparo se añade en el siguiente step
+                elif event.key == pygame.K_F3:
+                    # Muestra u oculta el perfilador de fotogramas
+                    profiler.toggle()
                 elif event.key == pygame.K_BACKSPACE:
                     input_buffer = input_buffer[:-1]
                 elif event.key == pygame.K_RETURN:
@@ -812,53 +2984,443 @@ def main():
                     if event.unicode.isalpha():
                         input_buffer += event.unicode
         
-        # Actualización de estados
-        move_player()
-        update_enemies(dt)
-        update_player_shots()
-        update_enemy_projectiles()
-        
-        # Generación controlada de enemigos: se generan tres enemigos por cada ciclo de spawn
-        enemy_spawn_timer += dt
-        if enemy_spawn_timer >= enemy_spawn_interval:
-            for _ in range(3):
-                new_enemy = spawn_enemy()
-                if new_enemy:
-                    new_enemy["timer"] = 0.0
-                    enemies.append(new_enemy)
-            enemy_spawn_timer = 0.0
-        
-        # Renderizado de la escena 3D
-        screen.fill(BLACK)
-        draw_walls(screen)
-        draw_enemies(screen)
-        draw_player_shots(screen)      # Disparos del jugador
-        draw_enemy_projectiles(screen) # Disparos de los enemigos
-        
-        if show_map:
-            draw_minimap(screen, scale=6)
-        
-        # HUD: muestra las vidas como cuadrados rojos en la esquina superior derecha
-        draw_lives(screen, player_lives)
+        # Fundido a negro desde la pantalla de inicio: la partida aún no se
+        # dibuja. Si el jugador ha salido del menú antes de que acabe el
+        # cálculo del PVS, la pantalla sigue en negro (atendiendo eventos)
+        # hasta que termine.
+        if transition.phase == "out" or pvs_building():
+            if transition.phase == "out":
+                transition.update(dt)
+            transition.draw(screen)
+            pygame.display.flip()
+            continue
         
-        # Dibuja el caliz (con el mismo factor de escala usado en el minimapa)
-        draw_caliz(screen, caliz, scale=6)
+        # Actualización de estados y renderizado
+        inputs = inputs_from_keys(pygame.key.get_pressed(), fire)
+        if transition.active:
+            # Fundido desde negro sobre el primer fotograma, con la partida detenida
+            transition.update(dt)
+            inputs = NO_INPUT
+            dt = 0.0
+        frame_start = time.perf_counter()
+        if profiler.enabled:
+            profiler.mark("events")
+            events = run_frame(screen, dt, inputs, profiler.mark)
+            profiler.end_frame()
+        else:
+            events = run_frame(screen, dt, inputs)
+        resolution.update(time.perf_counter() - frame_start)
+        if "first_frame" not in STARTUP_TIMES:
+            # Creación de la partida y su primer fotograma (sin contar el fundido)
+            STARTUP_TIMES["first_frame"] = setup_time + time.perf_counter() - frame_start
+            if STARTUP_REPORT:
+                startup_report()
         
-        pygame.display.flip()
+        # Detección de victoria: si el jugador pasa por encima del caliz
+        if "caliz_reached" in events:
+            print("¡Has ganado!")
+            win_screen(screen)
+            # Reiniciamos el juego completamente para comenzar una nueva partida
+            main()
+            return
         
         # Condición de Game Over: si se agotan las vidas
-        if player_lives <= 0:
+        if "game_over" in events:
             print("Game Over")
             game_over_screen(screen)
             # Reiniciamos el juego completamente; llamamos recursivamente a main()
             main()
             return
     
+    if PROFILE_OUT and profiler.frames:
+        profiler.export(PROFILE_OUT)
     pygame.quit()
     sys.exit()
 
+# =====================================================
+# H. BENCHMARK SIN VENTANA
+# =====================================================
+
+class _PhaseRecorder:
+    """Función 'mark' para run_frame que guarda la duración de cada fase del fotograma."""
+
+    def __init__(self):
+        self.times = {}
+        self.last = time.perf_counter()
+
+    def __call__(self, phase):
+        now = time.perf_counter()
+        self.times[phase] = self.times.get(phase, 0.0) + now - self.last
+        self.last = now
+
+def _bench_room(width, height):
+    """Mapa rectangular vacío rodeado de muros."""
+    room = np.full((height, width), WALL_CELL, dtype=np.uint8)
+    room[1:-1, 1:-1] = OPEN_CELL
+    return room
+
+def _bench_inputs(frame):
+    """
+    Secuencia de entrada fija para los benchmarks: avanza, gira a un lado y
+    al otro en ciclos de dos segundos y dispara cada cuarto de segundo.
+    """
+    phase = frame % 120
+    return Inputs(forward=phase < 90, left=60 <= phase < 90, right=phase >= 90, fire=frame % 15 == 0)
+
+def _bench_setup(scenario, seed):
+    """
+    Deja el juego en el estado inicial del escenario. Devuelve una función
+    opcional que se llama antes de cada fotograma (fuera de la medición).
+    """
+    global world, show_map
+    rng = np.random.default_rng(seed)
+    show_map = False
+
+    start = (1.5, 1.5, 0.0)
+    if scenario == "empty_corridor":
+        set_game_map(_bench_room(MAZE_WIDTH, 3))
+    elif scenario in ("long_sightline", "projectiles_1000"):
+        # Sala abierta: vistas largas y sitio para que los proyectiles vuelen
+        # varios fotogramas antes de chocar con un muro
+        set_game_map(_bench_room(201, 201))
+        start = (100.5, 100.5, 0.0)
+    else:
+        set_game_map(generate_maze(MAZE_WIDTH, MAZE_HEIGHT, seed))
+    # run_frame no aplica el Game Over: la medición sigue aunque se agoten las vidas
+    world = GameState(seed, start, caliz={"x": MAP_WIDTH - 1.5, "y": MAP_HEIGHT - 1.5})
+    if USE_PVS:
+        start_pvs_build(wait=True)
+    enemies = world.enemies
+    enemy_projectiles = world.enemy_projectiles
+
+    open_y, open_x = np.nonzero(game_map == OPEN_CELL)
+    if scenario == "enemies_500":
+        for i in rng.integers(0, open_x.size, 500):
+            enemies.add(open_x[i] + 0.5, open_y[i] + 0.5)
+    elif scenario == "minimap":
+        show_map = True
+    elif scenario == "projectiles_1000":
+        def refill():
+            # Mantiene 1000 proyectiles vivos: los que chocan se reponen
+            for i in rng.integers(0, open_x.size, 1000 - enemy_projectiles.count):
+                enemy_projectiles.add(open_x[i] + rng.random(), open_y[i] + rng.random(),
+                                      rng.uniform(-math.pi, math.pi), world.enemy_projectile_speed)
+        return refill
+    return None
+
+def _percentiles(samples_ms):
+    p50, p95, p99 = np.percentile(samples_ms, (50, 95, 99))
+    return {"p50": round(float(p50), 4), "p95": round(float(p95), 4), "p99": round(float(p99), 4),
+            "mean": round(float(np.mean(samples_ms)), 4)}
+
+def run_benchmarks(scenarios=("empty_corridor", "long_sightline", "enemies_500", "projectiles_1000", "minimap"),
+                   frames=300, warmup=30, seed=1234):
+    """
+    Ejecuta el bucle del juego (run_frame) sin intervención humana sobre
+    escenarios fijos, con semilla y entrada guionizada fijas y dt constante.
+    Para cada escenario devuelve los percentiles del tiempo por fotograma y
+    por fase, el rendimiento en fotogramas por segundo y las asignaciones de
+    memoria (medidas con tracemalloc en una pasada aparte para no falsear los
+    tiempos).
+    """
+    import tracemalloc
+
+    screen = init_display()
+    dt = 1 / 60
+    report = {"seed": seed, "frames": frames, "rays": NUM_RAYS, "resolution": [WIDTH, HEIGHT],
+              "raycast": RAYCAST_BACKEND, "renderer": WALL_RENDERER, "floor": FLOOR_MODE,
+              "pvs": USE_PVS, "scenarios": {}}
+
+    for scenario in scenarios:
+        before_frame = _bench_setup(scenario, seed)
+        phase_ms = {phase: [] for phase in FRAME_PHASES}
+        frame_ms = []
+        for frame in range(warmup + frames):
+            if before_frame:
+                before_frame()
+            pygame.event.pump()
+            recorder = _PhaseRecorder()
+            start = recorder.last
+            run_frame(screen, dt, _bench_inputs(frame), recorder)
+            if frame >= warmup:
+                frame_ms.append((recorder.last - start) * 1000)
+                for phase, seconds in recorder.times.items():
+                    phase_ms[phase].append(seconds * 1000)
+
+        # Segunda pasada, más corta, solo para las asignaciones de memoria
+        before_frame = _bench_setup(scenario, seed)
+        alloc_kb = []
+        tracemalloc.start()
+        for frame in range(min(frames, 60)):
+            if before_frame:
+                before_frame()
+            inputs = _bench_inputs(frame)
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            run_frame(screen, dt, inputs)
+            _, peak = tracemalloc.get_traced_memory()
+            alloc_kb.append((peak - current) / 1024)
+        _, total_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        report["scenarios"][scenario] = {
+            "frame_ms": _percentiles(frame_ms),
+            "fps": round(1000 / float(np.mean(frame_ms)), 1),
+            "phases_ms": {phase: _percentiles(samples) for phase, samples in phase_ms.items()},
+            "alloc": {"per_frame_peak_kb": _percentiles(alloc_kb),
+                      "traced_peak_kb": round(total_peak / 1024, 1)},
+            "entities": {"enemies": world.enemies.count, "player_shots": world.player_shots.count,
+                         "enemy_projectiles": world.enemy_projectiles.count},
+        }
+    return report
+
+# =====================================================
+# I. BARRIDOS DE SEMILLAS Y PARÁMETROS EN PARALELO
+# =====================================================
+
+class RandomWalker:
+    """
+    Política "andar sin rumbo" para partidas sin jugador humano: va de centro
+    a centro de celda eligiendo al azar una celda vecina libre, sin volver
+    por donde vino salvo en un callejón sin salida, y dispara de vez en
+    cuando. Se llama con el GameState y devuelve las Inputs del paso.
+    """
+
+    def __init__(self, seed=None, fire_chance=0.02):
+        self.rng = random.Random(seed)
+        self.fire_chance = fire_chance
+        self.target = None
+        self.previous = None
+
+    def _next_target(self, level, cell):
+        x, y = cell
+        options = [(x + dx, y + dy) for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1))
+                   if not level.is_wall(x + dx, y + dy)]
+        forward = [c for c in options if c != self.previous]
+        self.previous = cell
+        return self.rng.choice(forward or options or [cell])
+
+    def __call__(self, state):
+        if self.target is None:
+            self.target = (int(state.player_x), int(state.player_y))
+        tx, ty = self.target[0] + 0.5, self.target[1] + 0.5
+        if math.hypot(tx - state.player_x, ty - state.player_y) < 0.15:
+            self.target = self._next_target(state.map, self.target)
+            tx, ty = self.target[0] + 0.5, self.target[1] + 0.5
+
+        # Gira hacia el centro de la celda objetivo; avanza mientras apunte más o menos a él
+        diff = math.atan2(ty - state.player_y, tx - state.player_x) - state.player_angle
+        diff = (diff + math.pi) % (2 * math.pi) - math.pi
+        turn = abs(diff) > state.player_turn_speed / 2
+        return Inputs(forward=abs(diff) < 0.5, left=turn and diff < 0, right=turn and diff > 0,
+                      fire=self.rng.random() < self.fire_chance)
+
+SWEEP_POLICIES = {"random_walk": RandomWalker}
+
+# Columnas del resultado de un barrido: (nombre, dtype)
+SWEEP_COLUMNS = (("seed", np.int64), ("maze_width", np.int32), ("maze_height", np.int32),
+                 ("spawn_interval", np.float64), ("projectile_speed", np.float64), ("shot_speed", np.float64),
+                 ("reached", np.bool_), ("time_to_caliz", np.float64), ("sim_time", np.float64),
+                 ("lives_lost", np.int16), ("enemies_spawned", np.int32), ("enemies_killed", np.int32),
+                 ("shots_fired", np.int32))
+
+def simulate_run(seed, maze_size=(MAZE_WIDTH, MAZE_HEIGHT), spawn_interval=enemy_spawn_interval,
+                 projectile_speed=enemy_projectile_speed, shot_speed=player_shot_speed,
+                 max_time=300.0, policy="random_walk"):
+    """
+    Juega una partida completa sin pygame: laberinto y partida con la misma
+    semilla, la política indicada y las reglas dadas. Termina al alcanzar el
+    caliz, al perder todas las vidas o tras 'max_time' segundos de juego.
+    Devuelve una tupla con los campos de SWEEP_COLUMNS (time_to_caliz es NaN
+    si no se alcanzó).
+    """
+    state = GameState(seed, level=GameMap(generate_maze(maze_size[0], maze_size[1], seed)))
+    state.enemy_spawn_interval = spawn_interval
+    state.enemy_projectile_speed = projectile_speed
+    state.player_shot_speed = shot_speed
+    walker = SWEEP_POLICIES[policy](seed)
+
+    counts = collections.Counter()
+    max_ticks = int(round(max_time / SIM_DT))
+    reached = False
+    while state.ticks < max_ticks:
+        events = state.step(walker(state), SIM_DT)
+        counts.update(events)
+        if "caliz_reached" in events:
+            reached = True
+            break
+        if "game_over" in events:
+            break
+    return (seed, maze_size[0], maze_size[1], spawn_interval, projectile_speed, shot_speed,
+            reached, state.time if reached else math.nan, state.time, counts["player_hit"],
+            counts["enemy_spawned"], counts["enemy_hit"], counts["shot_fired"])
+
+def _sweep_job(job):
+    return simulate_run(*job)
+
+def run_sweep(seeds, maze_sizes=((MAZE_WIDTH, MAZE_HEIGHT),), spawn_intervals=(enemy_spawn_interval,),
+              projectile_speeds=(enemy_projectile_speed,), shot_speeds=(player_shot_speed,),
+              max_time=300.0, policy="random_walk", workers=None):
+    """
+    Ejecuta simulate_run para cada combinación de semilla y parámetros,
+    repartiendo las partidas entre 'workers' procesos (por defecto, uno por
+    núcleo). Las partidas son independientes, así que escala con los
+    núcleos; se envían en lotes para que el coste de comunicación sea
+    despreciable. Devuelve un diccionario columna -> array de NumPy, en el
+    orden de las combinaciones. Los procesos se crean con fork, así que
+    no debe haber ventana ni mezclador abiertos (init_display, init_mixer)
+    al llamarla: los hilos de SDL no sobreviven al fork.
+    """
+    jobs = [(seed, tuple(size), interval, proj_speed, shot_speed, max_time, policy)
+            for size, interval, proj_speed, shot_speed, seed
+            in itertools.product(maze_sizes, spawn_intervals, projectile_speeds, shot_speeds, seeds)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        rows = [_sweep_job(job) for job in jobs]
+    else:
+        chunksize = max(1, len(jobs) // (workers * 8))
+        with multiprocessing.Pool(workers) as pool:
+            rows = pool.map(_sweep_job, jobs, chunksize)
+    return {name: np.array([row[i] for row in rows], dtype=dtype)
+            for i, (name, dtype) in enumerate(SWEEP_COLUMNS)}
+
+def summarize_sweep(results):
+    """Resumen por combinación de parámetros: partidas, % de victorias, mediana del tiempo al caliz, medias."""
+    keys = ("maze_width", "maze_height", "spawn_interval", "projectile_speed", "shot_speed")
+    groups = collections.defaultdict(list)
+    for i, combo in enumerate(zip(*(results[k].tolist() for k in keys))):
+        groups[combo].append(i)
+    print(f"{'laberinto':>10} {'spawn':>6} {'proy.':>6} {'disp.':>6} {'partidas':>9} {'victorias':>10} "
+          f"{'t. caliz (s)':>13} {'vidas perd.':>12} {'enemigos':>9}")
+    for (w, h, interval, proj_speed, shot_speed), rows in groups.items():
+        times = results["time_to_caliz"][rows]
+        reached = np.isfinite(times)
+        median = float(np.median(times[reached])) if reached.any() else math.nan
+        print(f"{f'{w}x{h}':>10} {interval:>6g} {proj_speed:>6g} {shot_speed:>6g} {len(rows):>9} "
+              f"{reached.mean():>10.1%} {median:>13.1f} {results['lives_lost'][rows].mean():>12.2f} "
+              f"{results['enemies_spawned'][rows].mean():>9.1f}")
+
+STARTUP_TIMES["import"] = time.perf_counter() - _IMPORT_START
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="ENTropia 3D")
+    parser.add_argument("--raycast", choices=("numpy", "python"), default=RAYCAST_BACKEND,
+                        help="motor de raycasting a utilizar")
+    parser.add_argument("--renderer", choices=("framebuffer", "rects", "textured"), default=WALL_RENDERER,
+                        help="renderizador de columnas de muro")
+    parser.add_argument("--floor", choices=("none", "fog", "textured"), default=FLOOR_MODE,
+                        help="suelo y techo: negros, degradado por distancia o con textura")
+    parser.add_argument("--rays", type=int, default=NUM_RAYS,
+                        help=f"número de rayos por fotograma (máximo {WIDTH}, uno por columna)")
+    parser.add_argument("--dynamic-res", action="store_true",
+                        help="ajusta el número de rayos en marcha para mantener --target-fps")
+    parser.add_argument("--target-fps", type=float, default=60.0,
+                        help="fotogramas por segundo que intenta sostener la resolución dinámica")
+    parser.add_argument("--min-rays", type=int, default=resolution.min_rays,
+                        help="mínimo de rayos de la resolución dinámica")
+    parser.add_argument("--max-rays", type=int, default=resolution.max_rays,
+                        help="máximo de rayos de la resolución dinámica")
+    parser.add_argument("--fov", type=float, default=math.degrees(FOV),
+                        help="campo de visión en grados")
+    parser.add_argument("--seed", type=int, default=MAZE_SEED,
+                        help="semilla del laberinto (por defecto, aleatoria)")
+    parser.add_argument("--maze-size", type=int, nargs=2, metavar=("ANCHO", "ALTO"),
+                        default=(MAZE_WIDTH, MAZE_HEIGHT), help="dimensiones impares del laberinto")
+    parser.add_argument("--world", type=int, nargs=2, metavar=("ANCHO", "ALTO"),
+                        help="mundo muy grande (impar) guardado por bloques en disco en lugar del laberinto en memoria")
+    parser.add_argument("--world-file", metavar="RUTA",
+                        help="fichero del mundo de --world (se reutiliza si ya existe con ese tamaño)")
+    parser.add_argument("--bench-maze", action="store_true",
+                        help="mide tiempo y memoria del generador de laberintos y sale")
+    parser.add_argument("--bench-collisions", action="store_true",
+                        help="mide el coste de las colisiones entre entidades y sale")
+    parser.add_argument("--bench", action="store_true",
+                        help="ejecuta los benchmarks del bucle del juego sin ventana y sale")
+    parser.add_argument("--bench-frames", type=int, default=300,
+                        help="fotogramas medidos por escenario")
+    parser.add_argument("--bench-out", metavar="RUTA",
+                        help="guarda el informe JSON del benchmark en RUTA (por defecto, salida estándar)")
+    parser.add_argument("--pvs-cache", metavar="CARPETA",
+                        help="guarda y reutiliza en CARPETA el PVS (celdas visibles) de cada laberinto")
+    parser.add_argument("--no-pvs", action="store_true",
+                        help="no calcula el PVS: sin descarte de sprites ni de líneas de visión")
+    parser.add_argument("--sound-cache", metavar="CARPETA",
+                        help="guarda y reutiliza en CARPETA las muestras de los sonidos sintetizados")
+    parser.add_argument("--profile", action="store_true",
+                        help="arranca con el perfilador de fotogramas activo (se alterna con F3)")
+    parser.add_argument("--profile-out", metavar="RUTA",
+                        help="al salir, exporta el perfil a RUTA (.csv o trace-event JSON de Chrome)")
+    parser.add_argument("--sweep", type=int, metavar="N",
+                        help="juega N semillas por combinación de parámetros sin ventana, en paralelo, y sale")
+    parser.add_argument("--sweep-sizes", nargs="+", default=[f"{MAZE_WIDTH}x{MAZE_HEIGHT}"], metavar="ANCHOxALTO",
+                        help="tamaños de laberinto del barrido")
+    parser.add_argument("--sweep-spawn-intervals", nargs="+", type=float, default=[enemy_spawn_interval],
+                        metavar="S", help="intervalos de aparición de enemigos del barrido")
+    parser.add_argument("--sweep-projectile-speeds", nargs="+", type=float, default=[enemy_projectile_speed],
+                        metavar="V", help="velocidades de los proyectiles enemigos del barrido")
+    parser.add_argument("--sweep-shot-speeds", nargs="+", type=float, default=[player_shot_speed],
+                        metavar="V", help="velocidades de los disparos del jugador del barrido")
+    parser.add_argument("--sweep-max-time", type=float, default=300.0,
+                        help="segundos de juego como máximo por partida")
+    parser.add_argument("--sweep-workers", type=int, help="procesos del barrido (por defecto, uno por núcleo)")
+    parser.add_argument("--sweep-out", metavar="RUTA",
+                        help="guarda los resultados por partida en RUTA (.npz, una columna por campo)")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="informa del tiempo de arranque de cada subsistema al dibujar el primer fotograma")
+    parser.add_argument("--compare-raycast", action="store_true",
+                        help="compara salida y velocidad de ambos motores de raycasting y sale")
+    args = parser.parse_args()
+    RAYCAST_BACKEND = args.raycast
+    WALL_RENDERER = args.renderer
+    FLOOR_MODE = args.floor
+    configure_rays(max(1, min(WIDTH, args.rays)))
+    resolution.enabled = args.dynamic_res
+    resolution.budget = 1.0 / args.target_fps
+    resolution.min_rays = max(1, min(WIDTH, args.min_rays))
+    resolution.max_rays = max(resolution.min_rays, min(WIDTH, args.max_rays))
+    set_fov(math.radians(args.fov))
+    MAZE_SEED = args.seed
+    MAZE_WIDTH, MAZE_HEIGHT = args.maze_size
+    PROFILE_OUT = args.profile_out
+    SOUND_CACHE_DIR = args.sound_cache
+    PVS_CACHE_DIR = args.pvs_cache
+    USE_PVS = not args.no_pvs
+    profiler.show_hud = args.profile
+    profiler.enabled = args.profile or PROFILE_OUT is not None
+    STARTUP_REPORT = args.startup_report
+    if args.bench:
+        # Los benchmarks corren sin ventana ni dispositivo de audio
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+    if args.sweep:
+        sizes = [tuple(int(v) for v in size.lower().split("x")) for size in args.sweep_sizes]
+        start = time.perf_counter()
+        results = run_sweep(range(args.sweep), sizes, args.sweep_spawn_intervals, args.sweep_projectile_speeds,
+                            args.sweep_shot_speeds, args.sweep_max_time, workers=args.sweep_workers)
+        print(f"{results['seed'].size} partidas en {time.perf_counter() - start:.1f} s")
+        summarize_sweep(results)
+        if args.sweep_out:
+            np.savez_compressed(args.sweep_out, **results)
+    elif args.bench:
+        report = json.dumps(run_benchmarks(frames=args.bench_frames), indent=2)
+        if args.bench_out:
+            with open(args.bench_out, "w", encoding="utf-8") as f:
+                f.write(report)
+        else:
+            print(report)
+    elif args.bench_maze:
+        benchmark_maze_generation()
+    elif args.bench_collisions:
+        benchmark_collisions()
+    elif args.compare_raycast:
+        compare_raycast_backends()
+    else:
+        if args.world:
+            start = time.perf_counter()
+            set_game_map(open_world(args.world[0], args.world[1], MAZE_SEED, args.world_file))
+            STARTUP_TIMES["maze"] = time.perf_counter() - start
+        main()
 
 
 
@@ -0,0 +1,20 @@
+import importlib.util
+import os
+import pathlib
+
+import pytest
+
+# Las pruebas corren sin ventana ni dispositivo de audio
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+GAME_PATH = pathlib.Path(__file__).resolve().parent.parent / "entropia 3d.py"
+
+
+@pytest.fixture
+def game():
+    """Módulo del juego recién importado (el nombre del fichero lleva un espacio)."""
+    spec = importlib.util.spec_from_file_location("entropia3d", GAME_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import GAME_PATH
+
+
+def test_bench_writes_only_json_to_stdout():
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy")
+    result = subprocess.run([sys.executable, str(GAME_PATH), "--bench", "--bench-frames", "1"],
+                            capture_output=True, text=True, env=env, check=True)
+
+    report = json.loads(result.stdout)
+
+    assert "projectiles_1000" in report["scenarios"]
+
+
+def test_projectiles_scenario_keeps_its_projectiles_alive(game):
+    screen = game.init_display()
+    refill = game._bench_setup("projectiles_1000", 1234)
+    alive = []
+
+    def mark(phase):
+        if phase == "draw_walls":
+            alive.append(game.world.enemy_projectiles.count)
+
+    for frame in range(60):
+        refill()
+        game.run_frame(screen, 1 / 60, game._bench_inputs(frame), mark)
+
+    assert min(alive) > 900
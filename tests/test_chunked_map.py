@@ -0,0 +1,17 @@
+import numpy as np
+
+
+def test_chunked_map_matches_the_array_map(game, tmp_path):
+    path = str(tmp_path / "world.map")
+    world_map = game.generate_world(path, 201, 131, seed=5)
+    maze = world_map.region(0, 0, 201, 131)
+    rng = np.random.default_rng(0)
+    xs = rng.uniform(-3, 204, 5000)
+    ys = rng.uniform(-3, 134, 5000)
+
+    game.set_game_map(maze)
+    in_memory = game.walls_at(xs, ys)
+    game.set_game_map(world_map)
+
+    assert np.array_equal(game.walls_at(xs, ys), in_memory)
+    assert np.array_equal(game.map_region(-5, -5, 70, 70), maze[:70, :70])
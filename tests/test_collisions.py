@@ -0,0 +1,39 @@
+import numpy as np
+
+
+def _room_state(game, x, y, angle, width=11, height=5, walls=()):
+    room = np.full((height, width), game.WALL_CELL, dtype=np.uint8)
+    room[1:-1, 1:-1] = game.OPEN_CELL
+    for cx, cy in walls:
+        room[cy, cx] = game.WALL_CELL
+    return game.GameState(seed=0, start=(x, y, angle), caliz={"x": width - 1.5, "y": height - 1.5},
+                          level=game.GameMap(room))
+
+
+def _fire(game, state):
+    events = []
+    state.fire(events)
+    game.update_player_shots(state, events)
+    return events
+
+
+def test_fast_shot_stops_at_the_wall_next_to_the_player(game):
+    # Detrás del muro sigue la sala: el paso acaba en una celda libre
+    state = _room_state(game, 1.5, 2.5, 0.0, walls=[(2, 2)])
+    assert state.player_shot_speed == 4
+
+    events = _fire(game, state)
+
+    assert "wall_hit" in events
+    assert state.player_shots.count == 0
+
+
+def test_fast_shot_hits_the_enemy_next_to_the_player(game):
+    state = _room_state(game, 1.5, 2.5, 0.0)
+    state.enemies.add(2.5, 2.5)
+
+    events = _fire(game, state)
+
+    assert "enemy_hit" in events
+    assert state.enemies.count == 0
+    assert state.player_shots.count == 0
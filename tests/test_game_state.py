@@ -0,0 +1,26 @@
+def _play(game, states, ticks=2000):
+    """Avanza las partidas a la vez, paso a paso, y devuelve sus eventos y posiciones finales."""
+    for state in states:
+        state.enemy_spawn_interval = 0.5  # Muchos enemigos: se ejercitan la línea de visión y los disparos
+    logs = [[] for _ in states]
+    for tick in range(ticks):
+        for state, log in zip(states, logs):
+            log.extend(state.tick(game._bench_inputs(tick)))
+    return [(log, state.player_x, state.player_y, state.enemies.x[:state.enemies.count].tolist())
+            for state, log in zip(states, logs)]
+
+
+def test_game_states_with_different_maps_are_independent(game):
+    # Sala abierta: los enemigos ven al jugador y disparan
+    room = game._bench_room(15, 15)
+    other = game.GameMap(game.generate_maze(41, 21, seed=2))
+    [alone] = _play(game, [game.GameState(seed=3, lives=1000, level=game.GameMap(room))])
+
+    # Con otro mapa instalado y otra partida avanzando a la vez, la primera no cambia
+    game.set_game_map(other)
+    first, second = _play(game, [game.GameState(seed=3, lives=1000, level=game.GameMap(room)),
+                                 game.GameState(seed=3, lives=1000, level=other)])
+
+    assert first == alone
+    assert "enemy_fired" in alone[0]
+    assert second != alone
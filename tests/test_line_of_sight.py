@@ -0,0 +1,25 @@
+import random
+
+import numpy as np
+
+
+def test_line_of_sight_matches_lines_of_sight(game):
+    level = game.GameMap(game.generate_maze(31, 31, seed=3))
+    rng = random.Random(0)
+    corner_results = set()
+    for _ in range(40):
+        tx, ty = rng.randrange(1, 30), rng.randrange(1, 30)
+        # Segmentos al azar y diagonales exactas entre centros de celda, que
+        # pasan justo por las esquinas de la cuadrícula
+        sources = [(rng.uniform(0, 31), rng.uniform(0, 31)) for _ in range(30)]
+        for _ in range(30):
+            k = rng.randrange(1, 8)
+            sources.append((tx + 0.5 + rng.choice((-k, k)), ty + 0.5 + rng.choice((-k, k))))
+        xs, ys = np.array(sources).T
+
+        batched = game.lines_of_sight(level, xs, ys, tx + 0.5, ty + 0.5)
+
+        scalar = [game.line_of_sight(level, x, y, tx + 0.5, ty + 0.5) for x, y in sources]
+        assert batched.tolist() == scalar
+        corner_results.update(scalar[30:])
+    assert corner_results == {True, False}
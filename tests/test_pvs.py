@@ -0,0 +1,41 @@
+import numpy as np
+
+
+def test_build_pvs_skips_maps_above_the_open_cell_limit(game):
+    maze = game.generate_maze(41, 41, seed=0)
+    open_cells = int(np.count_nonzero(maze == game.OPEN_CELL))
+
+    assert game.build_pvs(maze, max_open_cells=open_cells - 1) is None
+    assert game.build_pvs(maze, max_open_cells=open_cells) is not None
+
+
+def test_default_limit_covers_the_default_maze_but_not_large_ones(game):
+    default = game.generate_maze(game.MAZE_WIDTH, game.MAZE_HEIGHT, seed=0)
+    large = game.generate_maze(251, 251, seed=0)
+
+    assert np.count_nonzero(default == game.OPEN_CELL) <= game.PVS_MAX_OPEN_CELLS
+    assert game.build_pvs(large) is None
+
+
+def test_batched_build_matches_a_single_batch(game):
+    maze = game.generate_maze(41, 41, seed=3)
+    game.PVS_BATCH_CELLS = 10**6
+    whole = game.build_pvs(maze)
+    game.PVS_BATCH_CELLS = 37
+    batched = game.build_pvs(maze)
+
+    assert np.array_equal(whole.indptr, batched.indptr)
+    assert np.array_equal(whole.indices, batched.indices)
+    assert np.array_equal(whole.reach, batched.reach)
+
+
+def test_pvs_builds_in_the_background(game):
+    level = game.set_game_map(game.generate_maze(game.MAZE_WIDTH, game.MAZE_HEIGHT, seed=0))
+
+    game.start_pvs_build()
+
+    assert game.pvs_building()
+    assert level.pvs is None
+    game._pvs_thread.join()
+    assert not game.pvs_building()
+    assert level.pvs is not None
@@ -0,0 +1,23 @@
+import numpy as np
+
+
+def _assert_backends_match(game, samples=300):
+    for game.player_x, game.player_y, game.player_angle in game.raycast_poses(samples):
+        game.cast_rays_python()
+        distances, wall_u, wall_side = game.z_buffer.copy(), game.wall_u.copy(), game.wall_side.copy()
+        game.cast_rays_numpy()
+        np.testing.assert_allclose(game.z_buffer, distances, rtol=1e-9, atol=0)
+        np.testing.assert_allclose(game.wall_u, wall_u, rtol=0, atol=1e-9)
+        np.testing.assert_array_equal(game.wall_side, wall_side)
+
+
+def test_numpy_backend_matches_python_backend(game):
+    _assert_backends_match(game)
+
+
+def test_pvs_bounded_numpy_backend_matches_python_backend(game):
+    level = game.set_game_map(game.generate_maze(41, 41, seed=5))
+    game.start_pvs_build(wait=True)
+    assert level.pvs is not None
+
+    _assert_backends_match(game)
@@ -0,0 +1,14 @@
+import pytest
+
+
+@pytest.mark.parametrize("floor", ["none", "fog", "textured"])
+@pytest.mark.parametrize("renderer", ["framebuffer", "rects", "textured"])
+def test_python_backend_draws_walls(game, renderer, floor):
+    game.RAYCAST_BACKEND = "python"
+    game.WALL_RENDERER = renderer
+    game.FLOOR_MODE = floor
+    screen = game.init_display()
+
+    game.draw_walls(screen)
+
+    assert (game.z_buffer > 0).all()
@@ -0,0 +1,12 @@
+def test_import_has_no_side_effects(game):
+    assert game.pygame is None
+    assert game.current_map is None
+    assert game.world is None
+
+
+def test_first_game_state_generates_the_maze(game):
+    state = game.GameState(seed=0)
+
+    assert state.map is game.current_map
+    assert (game.MAP_WIDTH, game.MAP_HEIGHT) == (game.MAZE_WIDTH, game.MAZE_HEIGHT)
+    assert "maze" in game.STARTUP_TIMES